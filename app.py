@@ -1,30 +1,122 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify
-from werkzeug.security import generate_password_hash
-from datetime import datetime
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify, g,
+                   has_app_context, stream_with_context)
+from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.datastructures import CallbackDict
+from flask.sessions import SessionInterface, SessionMixin
+from datetime import datetime, timedelta
 import sqlite3
 import os
+import queue
+import re
+import sys
 import pandas as pd
 import math
 from num2words import num2words
+import click
+import base64
 import csv
+import io
+import hashlib
+import json
+import secrets
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from io import StringIO
 from flask import Response, send_file
 
+from duct_calc import (calculate_duct, calculate_ducts,
+                       INPUT_COLUMNS as DUCT_INPUT_COLUMNS, DERIVED_COLUMNS as DUCT_DERIVED_COLUMNS)
+from xlsx_stream import iter_xlsx, iter_zip, XLSX_MIMETYPE
+
 app = Flask(__name__)
 app.secret_key = 'secretkey'
 
-def get_db():
-    conn = sqlite3.connect("database.db")
+DATABASE = os.environ.get("DATABASE", "database.db")
+
+# ---------- ✅ Database Connections ----------
+# Connections are pooled per worker and handed out one per app context, so a
+# request reuses a single connection and returns it in teardown_appcontext.
+
+SQLITE_TIMEOUT = 30  # seconds to wait on a locked database
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+SQLITE_PRAGMAS = [
+    ("journal_mode", "WAL"),        # readers no longer block behind writers
+    ("synchronous", "NORMAL"),      # safe with WAL, far fewer fsyncs
+    ("busy_timeout", 5000),         # ms to retry instead of "database is locked"
+    ("cache_size", -20000),         # negative = KiB, i.e. ~20 MB page cache
+    ("mmap_size", 268435456),       # 256 MB memory-mapped reads
+]
+
+_db_pool = queue.LifoQueue(maxsize=SQLITE_POOL_SIZE)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that survives close() so it can go back to the pool.
+
+    Routes still call conn.close() when they are done; for a pooled
+    connection that only discards uncommitted work.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+def open_db(factory=sqlite3.Connection):
+    conn = sqlite3.connect(DATABASE, timeout=SQLITE_TIMEOUT, factory=factory,
+                           check_same_thread=factory is sqlite3.Connection)
     conn.row_factory = sqlite3.Row
+    for name, value in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
     return conn
 
+
+def get_db():
+    if not has_app_context():
+        # Scripts and background threads get a private connection
+        return open_db()
+    if "db" not in g:
+        try:
+            g.db = _db_pool.get_nowait()
+        except queue.Empty:
+            g.db = open_db(PooledConnection)
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+        _db_pool.put_nowait(conn)
+    except (sqlite3.Error, queue.Full):
+        conn.really_close()
+
 def get_db_connection():
     return get_db()
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
+# ---------- ✅ Schema Migrations ----------
+# Each step runs exactly once per database and is recorded in schema_version.
+# Append new steps to MIGRATIONS; never edit or reorder a step that has shipped.
 
+def add_column_if_missing(cur, table, column_name, column_def):
+    cur.execute(f"PRAGMA table_info({table})")
+    if column_name not in [row[1] for row in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column_name} {column_def}")
+
+
+def migration_initial_schema(cur):
     cur.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -91,9 +183,6 @@ def init_db():
         )
     ''')
 
-
-
-    # Create the projects table
     cur.execute('''
         CREATE TABLE IF NOT EXISTS projects (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -117,9 +206,6 @@ def init_db():
         )
     ''')
 
-    
-
-
     cur.execute('''
         CREATE TABLE IF NOT EXISTS duct_entries (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -145,9 +231,8 @@ def init_db():
         )
     ''')
 
-    cur.execute("DROP TABLE IF EXISTS production_progress")
     cur.execute('''
-        CREATE TABLE production_progress (
+        CREATE TABLE IF NOT EXISTS production_progress (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             project_id INTEGER NOT NULL,
             sheet_cutting_sqm REAL DEFAULT 0,
@@ -190,6 +275,21 @@ def init_db():
         )
     """)
 
+
+def migration_missing_columns(cur):
+    # Formerly applied by hand through /setup_db
+    add_column_if_missing(cur, "production_progress", "quality_check_percent", "REAL DEFAULT 0")
+    add_column_if_missing(cur, "production_progress", "dispatch_percent", "REAL DEFAULT 0")
+
+    # Written by add_measurement and production but never declared
+    add_column_if_missing(cur, "projects", "client_name", "TEXT")
+    add_column_if_missing(cur, "projects", "site_location", "TEXT")
+    add_column_if_missing(cur, "projects", "engineer_name", "TEXT")
+    add_column_if_missing(cur, "projects", "mobile", "TEXT")
+    add_column_if_missing(cur, "projects", "total_sqm", "REAL DEFAULT 0")
+
+
+def migration_seed_data(cur):
     cur.execute('''
         INSERT OR IGNORE INTO summary_reports (
             project_id, diagram,
@@ -208,8 +308,11 @@ def init_db():
         ('VE/EMP/0003', 'Priya R', 'Designer', '9876543212', 'priya@example.com', 'default.jpg', '2024-01-15')
     ]
     for emp in dummy_employees:
+        cur.execute("SELECT 1 FROM employees WHERE emp_id = ?", (emp[0],))
+        if cur.fetchone():
+            continue
         cur.execute('''
-            INSERT OR IGNORE INTO employees (emp_id, name, role, phone, email, photo_filename, join_date)
+            INSERT INTO employees (emp_id, name, role, phone, email, photo_filename, join_date)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', emp)
 
@@ -220,6 +323,9 @@ def init_db():
         ('VE/EMP/0003', today, 'Present', '09:15', '17:45')
     ]
     for record in dummy_attendance:
+        cur.execute("SELECT 1 FROM attendance WHERE emp_id = ? AND date = ?", record[:2])
+        if cur.fetchone():
+            continue
         cur.execute('''
             INSERT INTO attendance (emp_id, date, status, check_in, check_out)
             VALUES (?, ?, ?, ?, ?)
@@ -235,36 +341,891 @@ def init_db():
         VALUES (?, ?, ?, ?, ?, ?, ?)
     ''', (1, "Dummy Vendor Pvt Ltd", "29ABCDE1234F2Z5", "123 Main Street, City", "Axis Bank", "1234567890", "UTIB0000123"))
 
+    cur.execute("SELECT 1 FROM vendor_contacts WHERE vendor_id = 1")
+    if not cur.fetchone():
+        cur.execute('''
+            INSERT INTO vendor_contacts (vendor_id, name, phone, email)
+            VALUES (?, ?, ?, ?)
+        ''', (1, "Mr. Dummy", "9876543210", "dummy@vendor.com"))
+
+
+def migration_secondary_indexes(cur):
+    # Marking attendance twice used to insert a second row; keep the latest
+    # mark for each employee and day so the unique index can be built.
     cur.execute('''
-        INSERT OR IGNORE INTO vendor_contacts (vendor_id, name, phone, email)
-        VALUES (?, ?, ?, ?)
-    ''', (1, "Mr. Dummy", "9876543210", "dummy@vendor.com"))
+        DELETE FROM attendance WHERE id NOT IN (
+            SELECT MAX(id) FROM attendance GROUP BY emp_id, date
+        )
+    ''')
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_emp_date ON attendance(emp_id, date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_duct_entries_project_id ON duct_entries(project_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_production_progress_project_id ON production_progress(project_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_emp_id ON employees(emp_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_department ON employees(department)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_role ON employees(role)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_vendor_contacts_vendor_id ON vendor_contacts(vendor_id)")
 
-    conn.commit()
-    conn.close()
 
-@app.before_request
-def setup_db_on_request():
-    init_db()
+def migration_project_totals(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS project_totals (
+            project_id INTEGER PRIMARY KEY,
+            duct_count INTEGER DEFAULT 0,
+            total_area REAL DEFAULT 0,
+            total_nuts REAL DEFAULT 0,
+            total_cleat REAL DEFAULT 0,
+            total_gasket REAL DEFAULT 0,
+            total_corner REAL DEFAULT 0,
+            total_weight REAL DEFAULT 0,
+            area_24g REAL DEFAULT 0,
+            area_22g REAL DEFAULT 0,
+            area_20g REAL DEFAULT 0,
+            area_18g REAL DEFAULT 0,
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )
+    ''')
+    for statement in project_totals_trigger_sql():
+        cur.execute(statement)
+    rebuild_project_totals(cur)
+
+
+def migration_duct_sort_indexes(cur):
+    # Serve the paginated duct table's sort orders straight from an index
+    for column in ("duct_no", "duct_type", "gauge", "area"):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_duct_entries_project_{column} "
+                    f"ON duct_entries(project_id, {column})")
+
+
+def migration_jobs(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            dedupe_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            artifact_path TEXT,
+            download_name TEXT,
+            mimetype TEXT,
+            error TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            started_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    # At most one queued or running job per identical request
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_inflight ON jobs(dedupe_key) "
+                "WHERE status IN ('queued', 'running')")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+
+
+def migration_data_versions(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for statement in data_version_trigger_sql():
+        cur.execute(statement)
+
+
+# Accounts that used to be hard-coded in the login route
+SEED_USERS = [
+    ("MD User", "md@company.com", "md123", "md"),
+    ("Project Manager", "pm@company.com", "pm123", "pm"),
+    ("Design Engineer", "de@company.com", "de123", "de"),
+]
+
+
+def is_password_hash(value):
+    return bool(value) and value.split(":", 1)[0] in ("pbkdf2", "scrypt")
+
+
+def migration_auth(cur):
+    for name, email, password, role in SEED_USERS:
+        cur.execute("INSERT OR IGNORE INTO users (name, email, password, role) VALUES (?, ?, ?, ?)",
+                    (name, email, password, role))
+
+    # Plaintext passwords (seed data) become werkzeug hashes
+    cur.execute("SELECT id, password FROM users")
+    for user_id, password in cur.fetchall():
+        if password and not is_password_hash(password):
+            cur.execute("UPDATE users SET password = ? WHERE id = ?", (generate_password_hash(password), user_id))
+
+    # Employees registered so far get a self-service login (username = email)
+    cur.execute('''
+        INSERT OR IGNORE INTO employee_logins (employee_id, username, password_hash, role)
+        SELECT emp_id, email, password, role FROM employees
+        WHERE emp_id IS NOT NULL AND email IS NOT NULL AND email != '' AND password IS NOT NULL
+    ''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)")
+
+
+def migration_production_events(cur):
+    # One current-state row per project, keeping the latest of any duplicates
+    cur.execute('''
+        DELETE FROM production_progress WHERE id NOT IN (
+            SELECT MAX(id) FROM production_progress GROUP BY project_id
+        )
+    ''')
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_production_progress_project_id "
+                "ON production_progress(project_id)")
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS production_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            delta REAL NOT NULL,
+            value REAL,
+            updated_by TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects(id)
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_production_events_project ON production_events(project_id, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_production_events_created ON production_events(created_at, stage)")
+
+    # Existing progress becomes the opening entry of each project's log, so
+    # rebuilding from the log reproduces it
+    for stage, column in PRODUCTION_STAGES.items():
+        cur.execute(f'''
+            INSERT INTO production_events (project_id, stage, delta, value, updated_by)
+            SELECT project_id, ?, {column}, {column}, 'migration'
+            FROM production_progress WHERE COALESCE({column}, 0) != 0
+        ''', (stage,))
+    cur.execute(production_event_trigger_sql())
+
+
+def migration_summary_reports(cur):
+    add_column_if_missing(cur, "summary_reports", "md_signature", "TEXT")
+    add_column_if_missing(cur, "summary_reports", "pm_signature", "TEXT")
+    add_column_if_missing(cur, "summary_reports", "data_version", "TEXT")
+    add_column_if_missing(cur, "summary_reports", "report_pdf", "BLOB")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_summary_reports_project ON summary_reports(project_id, data_version)")
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS summary_assets (
+            slot TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
 
-users_db = [
-    {"name": "MD User", "email": "md@company.com", "password": "md123", "role": "md"},
-    {"name": "Project Manager", "email": "pm@company.com", "password": "pm123", "role": "pm"},
-    {"name": "Design Engineer", "email": "de@company.com", "password": "de123", "role": "de"}
+def migration_summary_snapshots(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS summary_snapshots (
+            day TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            month TEXT,
+            vendor_id INTEGER,
+            status TEXT,
+            area_24g REAL DEFAULT 0,
+            area_22g REAL DEFAULT 0,
+            area_20g REAL DEFAULT 0,
+            area_18g REAL DEFAULT 0,
+            total_area REAL DEFAULT 0,
+            total_weight REAL DEFAULT 0,
+            sheet_cutting_sqm REAL DEFAULT 0,
+            plasma_fabrication_sqm REAL DEFAULT 0,
+            boxing_assembly_sqm REAL DEFAULT 0,
+            quality_check_pct REAL DEFAULT 0,
+            dispatch_percent REAL DEFAULT 0,
+            source_version TEXT,
+            PRIMARY KEY (day, project_id)
+        )
+    ''')
+
+
+def migration_project_search(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_projects_vendor_id ON projects(vendor_id)")
+    cur.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS project_search USING fts5(
+            {', '.join(PROJECT_SEARCH_COLUMNS)}, prefix='2 3'
+        )
+    ''')
+    rebuild_project_search(cur)
+    for statement in project_search_trigger_sql():
+        cur.execute(statement)
+
+
+def migration_vendor_name_index(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_vendors_name_nocase ON vendors(name COLLATE NOCASE)")
+
+
+def migration_vendor_gst_unique(cur):
+    cur.execute("UPDATE vendors SET gst = NULLIF(UPPER(REPLACE(TRIM(gst), ' ', '')), '')")
+    # Keep the oldest vendor per GSTIN, fill its blank fields from the others
+    # (oldest first) and move everything pointing at the others onto it
+    cur.execute("SELECT gst, MIN(id) FROM vendors WHERE gst IS NOT NULL GROUP BY gst HAVING COUNT(*) > 1")
+    for gst, keep in cur.fetchall():
+        cur.execute("SELECT id, name FROM vendors WHERE gst = ? AND id != ? ORDER BY id", (gst, keep))
+        dropped = cur.fetchall()
+        for column in ("name", "address", "bank_name", "account_number", "ifsc"):
+            cur.execute(f'''
+                UPDATE vendors SET {column} = COALESCE(NULLIF(TRIM({column}), ''), (
+                    SELECT {column} FROM vendors
+                    WHERE gst = ? AND id != ? AND NULLIF(TRIM({column}), '') IS NOT NULL
+                    ORDER BY id LIMIT 1
+                )) WHERE id = ?
+            ''', (gst, keep, keep))
+        for table, column in (("projects", "vendor_id"), ("vendor_contacts", "vendor_id")):
+            cur.execute(f"UPDATE {table} SET {column} = ? "
+                        f"WHERE {column} IN (SELECT id FROM vendors WHERE gst = ? AND id != ?)", (keep, gst, keep))
+        cur.execute("DELETE FROM vendors WHERE gst = ? AND id != ?", (gst, keep))
+        print(f"⚠️ Merged vendors sharing GSTIN {gst} into vendor {keep}; dropped "
+              + ", ".join(f"{vendor_id} ({name or 'unnamed'})" for vendor_id, name in dropped))
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_vendors_gst ON vendors(gst) WHERE gst IS NOT NULL")
+
+
+def migration_job_owner(cur):
+    # Jobs queued before this have no owner and can no longer be fetched
+    add_column_if_missing(cur, "jobs", "created_by", "TEXT")
+
+
+def migration_unique_employees(cur):
+    # The old init_db re-seeded the demo employees on every request; keep the
+    # first row for each emp_id so the unique index can be built.
+    cur.execute('''
+        DELETE FROM employees WHERE emp_id IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM employees WHERE emp_id IS NOT NULL GROUP BY emp_id
+        )
+    ''')
+    cur.execute("DROP INDEX IF EXISTS idx_employees_emp_id")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_employees_emp_id ON employees(emp_id)")
+
+
+def migration_vendor_data_versions(cur):
+    # Creates only the triggers added to DATA_VERSION_SCOPES since migration 8
+    for statement in data_version_trigger_sql():
+        cur.execute(statement)
+
+
+def migration_project_filter_indexes(cur):
+    # The project list filters on the displayed status and the start date, and
+    # the dashboard counts projects per stored status
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_projects_status ON projects(status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_projects_list_status "
+                "ON projects(COALESCE(NULLIF(status, ''), 'new'))")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_projects_start_date ON projects(start_date)")
+
+
+MIGRATIONS = [
+    (1, "initial schema", migration_initial_schema),
+    (2, "add columns previously patched in by /setup_db", migration_missing_columns),
+    (3, "seed demo data", migration_seed_data),
+    (4, "secondary indexes on foreign-key and filter columns", migration_secondary_indexes),
+    (5, "materialized per-project duct totals", migration_project_totals),
+    (6, "duct table sort indexes", migration_duct_sort_indexes),
+    (7, "background jobs table", migration_jobs),
+    (8, "per-scope data versions for the artifact cache", migration_data_versions),
+    (9, "hashed passwords, seeded logins and server-side sessions", migration_auth),
+    (10, "production event log with one current-state row per project", migration_production_events),
+    (11, "stored summary reports and cached summary images", migration_summary_reports),
+    (12, "daily per-project summary snapshots", migration_summary_snapshots),
+    (13, "full-text project search index", migration_project_search),
+    (14, "case-insensitive vendor name index for typeahead", migration_vendor_name_index),
+    (15, "merge vendors sharing a GSTIN and make it unique", migration_vendor_gst_unique),
+    (16, "record who queued each job", migration_job_owner),
+    (17, "one row per employee id", migration_unique_employees),
+    (18, "data version triggers for vendors", migration_vendor_data_versions),
+    (19, "project list and dashboard filter indexes", migration_project_filter_indexes),
 ]
 
+
+def migrate_db(conn=None):
+    """Apply pending migrations in order. Returns the list of versions applied."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db()
+    cur = conn.cursor()
+    applied = []
+    try:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+
+        for version, description, step in MIGRATIONS:
+            # BEGIN IMMEDIATE takes the write lock up front so concurrent
+            # workers starting together apply each step only once.
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+                if cur.fetchone():
+                    conn.rollback()
+                    continue
+                step(cur)
+                cur.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                            (version, description))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"✅ Applied migration {version}: {description}")
+            applied.append(version)
+    finally:
+        if own_conn:
+            conn.close()
+    return applied
+
+
+_db_ready = False
+
+def init_db():
+    """Bring the schema up to date once per process."""
+    global _db_ready
+    if not _db_ready:
+        with app.app_context():
+            migrate_db()
+        _db_ready = True
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Apply pending schema migrations."""
+    applied = migrate_db()
+    print(f"Schema is at version {MIGRATIONS[-1][0]} ({len(applied)} migration(s) applied).")
+
+
+# ---------- ✅ Query Plan Check ----------
+# The filtered queries our routes run on every page view. Each one must be
+# answered through an index; `flask check-query-plans` fails on a full scan,
+# including a scan of a covering index. Queries that read a whole table by
+# design (whole-table counts, the monthly register, unfiltered exports) name
+# that table, and only a scan of that one table is allowed for them. The SQL
+# comes from the same constants and builders the routes execute, so the check
+# cannot drift from what is actually run.
+
+def hot_queries():
+    """(name, sql, params, whole_table) for every hot route query, with sample parameters."""
+    whole_table = [
+        ("dashboard", DASHBOARD_STATUS_SQL, (), "projects"),
+        ("dashboard", DASHBOARD_ATTENDANCE_SQL, ("2024-01-01",), "employees"),
+        ("dashboard", DASHBOARD_TOP_VENDORS_SQL, (), "p"),
+        ("employee_list", EMPLOYEE_DEPARTMENTS_SQL, (), "employees"),
+        ("employee_list", EMPLOYEE_ROLES_SQL, (), "employees"),
+        ("attendance_month", ATTENDANCE_MONTH_SQL, ("2024-01-01", "2024-01-31"), "e"),
+        ("export_attendance_excel", *attendance_rows_sql(), "a"),
+    ]
+    for sort in OVERVIEW_SORT_COLUMNS:
+        whole_table.append(("production_overview", production_overview_sql(sort, "desc"),
+                            (OVERVIEW_PAGE_SIZE, 0), "p"))
+    queries = [
+        ("open_session", SESSION_SQL, ("x",)),
+        ("authenticate", USER_LOGIN_SQL, ("md@company.com",)),
+        ("authenticate", EMPLOYEE_LOGIN_SQL, ("a@b.c",)),
+        ("dashboard", DASHBOARD_FABRICATION_SQL, ()),
+        ("open_project", PROJECT_WITH_VENDOR_SQL, (1,)),
+        ("get_vendor_details", f"{VENDOR_LOOKUP_SQL} WHERE v.id = ?", (1,)),
+        ("export_pdf", PDF_DUCT_ROWS_SQL, (1,)),
+        ("export_excel", PROJECT_XLSX_ROWS_SQL, (1,)),
+        ("production", PRODUCTION_PROGRESS_SQL, (1,)),
+        ("production", PRODUCTION_HISTORY_SQL, (1,)),
+        ("edit_employee", EMPLOYEE_BY_ID_SQL, ("VE/EMP/0001",)),
+        ("attendance_list", ATTENDANCE_DAY_SQL, ("2024-01-01",)),
+        ("attendance_list", ATTENDANCE_RECENT_SQL, ()),
+        ("submit_job", JOB_IN_FLIGHT_SQL, ("user:1:project_pdf:{}",)),
+        ("job_status", JOB_SQL, ("0",)),
+    ]
+    built = [
+        ("api_vendors", vendor_search_sql("", 20)),
+        ("api_vendors", vendor_search_sql("ac", 20)),
+        ("api_projects", project_page_sql(51)),
+        ("api_projects", project_page_sql(51, match='"ve"*', before_id=100)),
+        ("api_projects", project_page_sql(51, status="new")),
+        ("api_projects", project_page_sql(51, date_from="2024-01-01", date_to="2024-12-31")),
+        ("employee_list", employee_filter_sql("Production", "")),
+        ("employee_list", employee_filter_sql("", "Employee")),
+        ("export_attendance_excel", attendance_rows_sql("2024-01-01", "2024-01-31")),
+        ("export_attendance_excel", attendance_rows_sql(department="Production", emp_id="VE/EMP/0001")),
+    ]
+    for column in DUCT_SORT_COLUMNS.values():
+        for descending in (False, True):
+            built.append(("api_project_ducts", duct_page_sql(1, column, descending, 101)))
+            built.append(("api_project_ducts", duct_page_sql(1, column, descending, 101, duct_type="ST",
+                                                             gauge="24g", position=["x", 10])))
+    for group_sql in SUMMARY_GROUPS.values():
+        built.append(("api_summary", (summary_rollup_sql(group_sql), ["2024-01-01"])))
+        built.append(("api_summary", (summary_membership_sql(group_sql), ["2024-01-01"])))
+    return ([(name, sql, params, None) for name, sql, params in queries]
+            + [(name, sql, tuple(params), None) for name, (sql, params) in built]
+            + [(name, sql, tuple(params), table) for name, sql, params, table in whole_table])
+
+
+def find_full_scans(conn):
+    """Return (name, plan detail) for every hot query that scans a whole table."""
+    offenders = []
+    for name, sql, params, whole_table in hot_queries():
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        # Scans of a subquery's result (CO-ROUTINE / MATERIALIZE x) read no table
+        subqueries = {detail.split()[-1] for detail in plan if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+        # An unfiltered LIMIT query walked in its ORDER BY order stops after LIMIT rows;
+        # a WHERE inside a correlated subquery does not filter the walk
+        outer = sql
+        while re.search(r"\([^()]*\)", outer):
+            outer = re.sub(r"\([^()]*\)", "", outer)
+        bounded = (re.search(r"\bLIMIT\b", outer) and not re.search(r"\bWHERE\b", outer)
+                   and "USE TEMP B-TREE FOR ORDER BY" not in plan)
+        for detail in plan:
+            # FTS5 lookups show as a "SCAN ... VIRTUAL TABLE INDEX" over the full-text index
+            if (detail.startswith("SCAN ") and " VIRTUAL TABLE INDEX " not in detail
+                    and detail.split()[1] not in subqueries and detail.split()[1] != whole_table
+                    and not bounded):
+                offenders.append((name, detail))
+    return offenders
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fail if any hot route query falls back to a full table scan."""
+    offenders = find_full_scans(get_db())
+    for name, detail in offenders:
+        print(f"❌ {name}: {detail}")
+    if offenders:
+        sys.exit(1)
+    print(f"✅ All {len(hot_queries())} hot queries use an index.")
+
+
+# ---------- ✅ Project Totals ----------
+# project_totals holds the per-project sums shown on the project and
+# production pages. Triggers on duct_entries keep it current inside the same
+# transaction as every insert, update and delete, so a page reads one row
+# instead of re-summing every duct. `flask rebuild-totals` recomputes it.
+
+PROJECT_TOTAL_COLUMNS = {
+    "total_area": "COALESCE({row}.area, 0)",
+    "total_nuts": "COALESCE(CAST({row}.nuts_bolts AS REAL), 0)",
+    "total_cleat": "COALESCE(CAST({row}.cleat AS REAL), 0)",
+    "total_gasket": "COALESCE(CAST({row}.gasket AS REAL), 0)",
+    "total_corner": "COALESCE(CAST({row}.corner_pieces AS REAL), 0)",
+    "total_weight": "COALESCE({row}.weight, 0)",
+    "area_24g": "CASE WHEN UPPER(TRIM({row}.gauge)) = '24G' THEN COALESCE({row}.area, 0) ELSE 0 END",
+    "area_22g": "CASE WHEN UPPER(TRIM({row}.gauge)) = '22G' THEN COALESCE({row}.area, 0) ELSE 0 END",
+    "area_20g": "CASE WHEN UPPER(TRIM({row}.gauge)) = '20G' THEN COALESCE({row}.area, 0) ELSE 0 END",
+    "area_18g": "CASE WHEN UPPER(TRIM({row}.gauge)) = '18G' THEN COALESCE({row}.area, 0) ELSE 0 END",
+}
+
+
+def project_totals_trigger_sql():
+    def apply(row, sign):
+        sets = [f"duct_count = duct_count {sign} 1"] + [
+            f"{column} = {column} {sign} {expr.format(row=row)}"
+            for column, expr in PROJECT_TOTAL_COLUMNS.items()
+        ]
+        return (f"INSERT OR IGNORE INTO project_totals (project_id) VALUES ({row}.project_id);\n"
+                f"UPDATE project_totals SET {', '.join(sets)} WHERE project_id = {row}.project_id;")
+
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_duct_entries_totals_insert
+            AFTER INSERT ON duct_entries BEGIN
+            {apply("NEW", "+")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_duct_entries_totals_delete
+            AFTER DELETE ON duct_entries BEGIN
+            {apply("OLD", "-")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_duct_entries_totals_update
+            AFTER UPDATE OF project_id, area, gauge, nuts_bolts, cleat, gasket, corner_pieces, weight
+            ON duct_entries BEGIN
+            {apply("OLD", "-")}
+            {apply("NEW", "+")}
+            END""",
+    ]
+
+
+def rebuild_project_totals(cur, project_id=None):
+    """Recompute project_totals from duct_entries, for all projects or one."""
+    only_one = project_id is not None
+    params = (project_id,) if only_one else ()
+    cur.execute("DELETE FROM project_totals" + (" WHERE project_id = ?" if only_one else ""), params)
+    columns = ", ".join(PROJECT_TOTAL_COLUMNS)
+    sums = ", ".join(f"SUM({expr.format(row='d')})" for expr in PROJECT_TOTAL_COLUMNS.values())
+    cur.execute(f"""
+        INSERT INTO project_totals (project_id, duct_count, {columns})
+        SELECT d.project_id, COUNT(*), {sums}
+        FROM duct_entries d
+        WHERE d.project_id IS NOT NULL {"AND d.project_id = ?" if only_one else ""}
+        GROUP BY d.project_id
+    """, params)
+
+
+def get_project_totals(cur, project_id):
+    """Totals for one project rounded for display; zeros if it has no ducts."""
+    cur.execute("SELECT * FROM project_totals WHERE project_id = ?", (project_id,))
+    row = cur.fetchone()
+    totals = {column: round(row[column] or 0, 2) if row else 0.0 for column in PROJECT_TOTAL_COLUMNS}
+    totals["duct_count"] = row["duct_count"] if row else 0
+    return totals
+
+
+@app.cli.command("rebuild-totals")
+@click.option("--project-id", type=int, default=None, help="Only rebuild this project.")
+def rebuild_totals_command(project_id):
+    """Recompute the materialized per-project duct totals."""
+    conn = get_db()
+    rebuild_project_totals(conn.cursor(), project_id)
+    conn.commit()
+    print("✅ Project totals rebuilt.")
+
+
+# ---------- ✅ Artifact Cache ----------
+# Generated documents are cached on disk under a name derived from what they
+# were built from: the document kind, the data scope (e.g. "project:12") and
+# that scope's version in data_versions. Triggers bump the version on every
+# write, so a stale file is simply never asked for again and ages out of the
+# LRU. The cache is bounded by total bytes; a hit refreshes the file's mtime.
+
+ARTIFACT_CACHE_DIR = os.path.join(app.instance_path, "artifact_cache")
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get("ARTIFACT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+ARTIFACT_FORMAT_VERSION = 1  # bump when a renderer changes its output
+
+# (table, scope expression per row) - every write to the table bumps the scope
+DATA_VERSION_SCOPES = [
+    ("duct_entries", "'project:' || {row}.project_id"),
+    ("projects", "'project:' || {row}.id"),
+    ("employees", "'employee:' || {row}.emp_id"),
+    ("employees", "'employees'"),
+    ("attendance", "'attendance:' || substr({row}.date, 1, 7)"),
+    ("attendance", "'attendance'"),
+    ("vendors", "'vendors'"),
+    ("vendor_contacts", "'vendors'"),
+]
+
+
+def data_version_trigger_sql():
+    def bump(scope):
+        return (f"INSERT INTO data_versions (scope, version) VALUES ({scope}, 1) "
+                f"ON CONFLICT(scope) DO UPDATE SET version = version + 1;")
+
+    statements = []
+    for table in dict.fromkeys(table for table, _ in DATA_VERSION_SCOPES):
+        scopes = [scope for t, scope in DATA_VERSION_SCOPES if t == table]
+        for event, rows in (("INSERT", ["NEW"]), ("UPDATE", ["OLD", "NEW"]), ("DELETE", ["OLD"])):
+            body = "\n".join(bump(scope.format(row=row)) for row in rows for scope in scopes)
+            statements.append(f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                {body}
+                END""")
+    return statements
+
+
+def data_version(cur, scope):
+    cur.execute("SELECT version FROM data_versions WHERE scope = ?", (scope,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def artifact_path(kind, scope, extension):
+    """Cache path of the `kind` document for the current version of `scope`."""
+    version = data_version(get_db().cursor(), scope)
+    key = hashlib.sha256(f"{ARTIFACT_FORMAT_VERSION}|{kind}|{scope}|{version}".encode()).hexdigest()
+    return os.path.join(ARTIFACT_CACHE_DIR, f"{key}.{extension}")
+
+
+def cached_artifact(kind, scope, extension, writer):
+    """Path of the cached `kind` document for the current version of `scope`.
+
+    On a miss `writer(out)` renders it into a private temp file that is then
+    moved into place, so concurrent requests never see a half-written file.
+    """
+    path = artifact_path(kind, scope, extension)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    os.makedirs(ARTIFACT_CACHE_DIR, exist_ok=True)
+    partial = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(partial, "wb") as out:
+            writer(out)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    evict_artifact_cache(keep=path)
+    return path
+
+
+def tee_artifact(path, chunks):
+    """Yield `chunks` to the client while writing them to the cache at `path`.
+
+    `chunks` must read from its own connection (see iter_project_xlsx), not
+    the request's, which is back in the pool once the view returns. The file
+    only moves into place after the source is exhausted without error; if the
+    render fails or the client disconnects, the partial file is dropped and
+    the source is closed so its connection is released straight away.
+    """
+    os.makedirs(ARTIFACT_CACHE_DIR, exist_ok=True)
+    partial = f"{path}.{uuid.uuid4().hex}.part"
+    complete = False
+    try:
+        with open(partial, "wb") as out:
+            for chunk in chunks:
+                out.write(chunk)
+                yield chunk
+        complete = True
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        if complete:
+            os.replace(partial, path)
+        elif os.path.exists(partial):
+            os.remove(partial)
+    evict_artifact_cache(keep=path)
+
+
+def evict_artifact_cache(keep=None):
+    """Delete least recently used artifacts until the cache fits its budget."""
+    entries = []
+    for entry in os.scandir(ARTIFACT_CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith(".part"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= ARTIFACT_CACHE_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+ARTIFACT_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def send_generated(writer, download_name, mimetype):
+    """Render an uncached document and send it.
+
+    `writer(out)` fills a spooled temp file: it stays in memory up to
+    ARTIFACT_SPOOL_BYTES, then moves to an anonymous file on disk. Each
+    request gets its own, and it is closed (and deleted) with the response.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=ARTIFACT_SPOOL_BYTES)
+    try:
+        writer(spool)
+        size = spool.tell()
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    response = send_file(spool, as_attachment=True, download_name=download_name, mimetype=mimetype)
+    response.content_length = size
+    return response
+
+
+# ---------- ✅ In-Process Cache ----------
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire `ttl` seconds after they
+    are set; the least recently used entry goes first once `maxsize` is hit."""
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# ---------- ✅ Sessions ----------
+# Session data lives in the sessions table; the cookie only carries a random
+# id. Every request reads its row by primary key, so all workers see the same
+# data, and the expiry is only pushed forward (one write) once half of the
+# lifetime has passed.
+
+SESSION_LIFETIME = timedelta(hours=int(os.environ.get("SESSION_LIFETIME_HOURS", 12)))
+
+
+class SqliteSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.expires_at = expires_at
+        self.new = new
+        self.old_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        """Move the session to a fresh id (call on login against fixation)."""
+        if not self.new:
+            self.old_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+SESSION_SQL = "SELECT data, expires_at FROM sessions WHERE id = ?"
+
+
+class SqliteSessionInterface(SessionInterface):
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = get_db().execute(SESSION_SQL, (sid,)).fetchone()
+            if row and row["expires_at"] > datetime.utcnow().isoformat():
+                return SqliteSession(json.loads(row["data"]), sid=sid, expires_at=row["expires_at"])
+        return SqliteSession(new=True)
+
+    def save_session(self, app, session, response):
+        conn = get_db()
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.old_sid:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session.old_sid,))
+
+        if not session:
+            if not session.new:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (session.sid,))
+                conn.commit()
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.utcnow()
+        refresh_due = (session.expires_at is not None
+                       and session.expires_at < (now + SESSION_LIFETIME / 2).isoformat())
+        if not (session.modified or refresh_due):
+            return
+
+        expires = now + SESSION_LIFETIME
+        conn.execute("""
+            INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+        """, (session.sid, json.dumps(dict(session)), expires.isoformat()))
+        conn.commit()
+        response.set_cookie(name, session.sid, expires=expires, httponly=True, domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+app.session_interface = SqliteSessionInterface()
+
+
+def purge_expired_sessions(conn):
+    conn.execute("DELETE FROM sessions WHERE expires_at < ?", (datetime.utcnow().isoformat(),))
+    conn.commit()
+
+
+# ---------- ✅ Authentication ----------
+# Staff accounts live in users, employee self-service accounts in
+# employee_logins; both store werkzeug password hashes. Roles are looked up
+# through a short-lived in-process cache so authorization checks stay cheap.
+
+ROLE_CACHE_TTL = 60
+
+_role_cache = TTLCache(ROLE_CACHE_TTL, maxsize=4096)
+
+
+USER_LOGIN_SQL = "SELECT id, name, role, password FROM users WHERE email = ?"
+EMPLOYEE_LOGIN_SQL = """
+    SELECT l.employee_id, l.password_hash, l.role, e.name
+    FROM employee_logins l
+    LEFT JOIN employees e ON e.emp_id = l.employee_id
+    WHERE l.username = ?
+"""
+
+
+def authenticate(email, password):
+    """Return {user_key, name, role} for valid credentials, else None."""
+    cur = get_db().cursor()
+    cur.execute(USER_LOGIN_SQL, (email,))
+    user = cur.fetchone()
+    if user and user["password"] and check_password_hash(user["password"], password):
+        return {"user_key": f"user:{user['id']}", "name": user["name"], "role": user["role"]}
+
+    cur.execute(EMPLOYEE_LOGIN_SQL, (email,))
+    login = cur.fetchone()
+    if login and login["password_hash"] and check_password_hash(login["password_hash"], password):
+        return {"user_key": f"employee:{login['employee_id']}",
+                "name": login["name"] or email, "role": login["role"]}
+    return None
+
+
+def user_role(user_key):
+    """Current role for a session's user_key, cached for ROLE_CACHE_TTL seconds."""
+    role = _role_cache.get(user_key)
+    if role is None:
+        kind, _, ident = (user_key or "").partition(":")
+        if kind == "user":
+            row = get_db().execute("SELECT role FROM users WHERE id = ?", (ident,)).fetchone()
+        elif kind == "employee":
+            row = get_db().execute("SELECT role FROM employee_logins WHERE employee_id = ?", (ident,)).fetchone()
+        else:
+            row = None
+        role = row["role"] if row else ""
+        _role_cache.set(user_key, role)
+    return role
+
+
+def current_role():
+    if 'user_key' not in session:
+        return None
+    return user_role(session['user_key'])
+
+
 #---------- ✅ Login ----------
 @app.route('/', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        email = request.form['email']
+        email = request.form['email'].strip()
         password = request.form['password']
 
-        # 🔍 Search in mock database  
-        user = next((u for u in users_db if u['email'] == email and u['password'] == password), None)
+        user = authenticate(email, password)
 
         if user:
+            purge_expired_sessions(get_db())
+            session.clear()
+            session.regenerate()
             session['user'] = user['name']
+            session['user_key'] = user['user_key']
             session['role'] = user['role']
             flash("✅ Login successful!", "success")
             return redirect(url_for('dashboard'))
@@ -282,70 +1243,204 @@ def login():
 @app.route('/logout')
 def logout():
     session.clear()
+    session.regenerate()
     flash("🔒 You have been logged out.", "success")
     return redirect(url_for('login'))
 
 # ---------- ✅ Dashboard ----------
+# KPI tiles come from one set of aggregate queries over the materialized
+# project totals, cached in-process for DASHBOARD_KPI_TTL seconds, so opening
+# the dashboard does not re-sum ducts, production or attendance each time.
+# Which tiles a user sees depends on their role.
+
+DASHBOARD_KPI_TTL = 60
+DASHBOARD_TILES = ["projects", "fabrication", "backlog", "attendance", "vendors"]
+DASHBOARD_TILES_BY_ROLE = {
+    "md": DASHBOARD_TILES,
+    "admin": DASHBOARD_TILES,
+    "pm": ["projects", "fabrication", "backlog", "vendors"],
+    "de": ["projects", "fabrication", "backlog"],
+}
+# Employee self-service logins see no company-wide figures, whatever their role
+EMPLOYEE_DASHBOARD_TILES = []
+DEFAULT_DASHBOARD_TILES = []
+
+_dashboard_cache = TTLCache(DASHBOARD_KPI_TTL, maxsize=1)
+
+# Blank statuses count as 'new', as in the project list and summary rollup
+DASHBOARD_STATUS_SQL = """
+    SELECT COALESCE(NULLIF(status, ''), 'new') AS status, COUNT(*) AS n
+    FROM projects GROUP BY 1 ORDER BY 2 DESC
+"""
+
+# Projects moved to production and not yet fully dispatched
+DASHBOARD_FABRICATION_SQL = """
+    SELECT COUNT(*) AS projects,
+           COALESCE(SUM(t.total_area), 0) AS area,
+           COALESCE(SUM(MAX(t.total_area - COALESCE(pp.sheet_cutting_sqm, 0), 0)), 0) AS sheet_cutting,
+           COALESCE(SUM(MAX(t.total_area - COALESCE(pp.plasma_fabrication_sqm, 0), 0)), 0) AS plasma_fabrication,
+           COALESCE(SUM(MAX(t.total_area - COALESCE(pp.boxing_assembly_sqm, 0), 0)), 0) AS boxing_assembly,
+           COALESCE(SUM(t.total_area * (100 - MIN(COALESCE(pp.quality_check_pct, 0), 100)) / 100), 0)
+               AS quality_check,
+           COALESCE(SUM(t.total_area * (100 - MIN(COALESCE(pp.dispatch_percent, 0), 100)) / 100), 0)
+               AS dispatch
+    FROM projects p
+    JOIN project_totals t ON t.project_id = p.id
+    LEFT JOIN production_progress pp ON pp.project_id = p.id
+    WHERE p.status = 'submitted' AND COALESCE(pp.dispatch_percent, 0) < 100
+"""
+
+DASHBOARD_ATTENDANCE_SQL = """
+    SELECT (SELECT COUNT(*) FROM employees) AS employees,
+           COUNT(*) AS marked,
+           COALESCE(SUM(status = 'Present'), 0) AS present
+    FROM attendance WHERE date = ?
+"""
+
+# Driven from projects so the grouping walks the vendor_id index, not every vendor
+DASHBOARD_TOP_VENDORS_SQL = """
+    SELECT v.id, v.name, COUNT(p.id) AS projects, ROUND(COALESCE(SUM(t.total_area), 0), 2) AS area
+    FROM projects p
+    JOIN vendors v ON v.id = p.vendor_id
+    LEFT JOIN project_totals t ON t.project_id = p.id
+    GROUP BY p.vendor_id
+    ORDER BY area DESC
+    LIMIT 5
+"""
+
+
+def dashboard_kpis():
+    kpis = _dashboard_cache.get("kpis")
+    if kpis is not None:
+        return kpis
+
+    cur = get_db().cursor()
+    cur.execute(DASHBOARD_STATUS_SQL)
+    projects_by_status = [dict(row) for row in cur.fetchall()]
+
+    cur.execute(DASHBOARD_FABRICATION_SQL)
+    fabrication = cur.fetchone()
+
+    cur.execute(DASHBOARD_ATTENDANCE_SQL, (datetime.today().strftime('%Y-%m-%d'),))
+    attendance = dict(cur.fetchone())
+    attendance["ratio"] = round(attendance["present"] / attendance["employees"] * 100, 1) if attendance["employees"] else 0
+
+    cur.execute(DASHBOARD_TOP_VENDORS_SQL)
+    top_vendors = [dict(row) for row in cur.fetchall()]
+
+    kpis = {
+        "projects_by_status": projects_by_status,
+        "projects_total": sum(row["n"] for row in projects_by_status),
+        "fabrication_projects": fabrication["projects"],
+        "fabrication_sqm": round(fabrication["area"], 2),
+        "backlog": {
+            "Sheet Cutting": round(fabrication["sheet_cutting"], 2),
+            "Plasma Fabrication": round(fabrication["plasma_fabrication"], 2),
+            "Boxing & Assembly": round(fabrication["boxing_assembly"], 2),
+            "Quality Checking": round(fabrication["quality_check"], 2),
+            "Dispatch": round(fabrication["dispatch"], 2),
+        },
+        "attendance": attendance,
+        "top_vendors": top_vendors,
+        "generated_at": datetime.now().strftime('%H:%M:%S'),
+    }
+    _dashboard_cache.set("kpis", kpis)
+    return kpis
+
 
 @app.route('/dashboard')
 def dashboard():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template("dashboard.html", user=session['user'])
+    role = (current_role() or session.get('role') or '').lower()
+    if session.get('user_key', '').startswith('employee:'):
+        tiles = EMPLOYEE_DASHBOARD_TILES
+    else:
+        tiles = DASHBOARD_TILES_BY_ROLE.get(role, DEFAULT_DASHBOARD_TILES)
+    kpis = dashboard_kpis() if tiles else None
+    return render_template("dashboard.html", user=session['user'], role=role, tiles=tiles, kpis=kpis)
 
 
 @app.route("/setup_db")
 def setup_db():
-    conn = get_db()
-    cur = conn.cursor()
+    applied = migrate_db()
+    if applied:
+        return f"✅ Database setup complete! Applied migrations: {', '.join(map(str, applied))}"
+    return "✅ Database setup complete! Schema already up to date."
 
-    # Check and add missing columns safely
-    def add_column_if_missing(column_name, column_def):
-        try:
-            cur.execute(f"ALTER TABLE production_progress ADD COLUMN {column_name} {column_def}")
-            print(f"✅ Added column: {column_name}")
-        except sqlite3.OperationalError as e:
-            if f"duplicate column name: {column_name}" in str(e).lower():
-                print(f"⚠️ Column already exists: {column_name}")
-            else:
-                print(f"❌ Error adding column {column_name}: {e}")
+# ---------- ✅ Vendor Registration ----------
 
-    add_column_if_missing("quality_check_percent", "REAL DEFAULT 0")
-    add_column_if_missing("dispatch_percent", "REAL DEFAULT 0")
+GSTIN_PATTERN = re.compile(r"^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][1-9A-Z]Z[0-9A-Z]$")
+GSTIN_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
 
-    conn.commit()
-    conn.close()
-    return "✅ Database setup complete!"
 
-# ---------- ✅ Vendor Registration ----------
+def normalize_gstin(value):
+    return re.sub(r"\s+", "", str(value or "")).upper()
+
+
+def gstin_format_error(gstin):
+    """Why `gstin` is not shaped like a GSTIN, or None."""
+    if len(gstin) != 15:
+        return "GSTIN must be 15 characters"
+    if not GSTIN_PATTERN.match(gstin):
+        return "GSTIN format is invalid"
+    return None
+
+
+def gstin_checksum_matches(gstin):
+    """True if the last character of a well-formed `gstin` is the base-36
+    check digit over the first fourteen."""
+    total = 0
+    for i, char in enumerate(gstin[:14]):
+        product = GSTIN_CHARS.index(char) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return GSTIN_CHARS[(36 - total % 36) % 36] == gstin[14]
+
+
+def gstin_error(gstin):
+    """Why `gstin` is not a valid GSTIN (format or check digit), or None."""
+    error = gstin_format_error(gstin)
+    if error is None and not gstin_checksum_matches(gstin):
+        error = "GSTIN checksum does not match"
+    return error
+
 
 @app.route('/vendor_registration', methods=['GET', 'POST'])
 def vendor_registration():
     if request.method == 'POST':
         vendor_name = request.form['vendor_name']
-        gst = request.form['gst']
+        gst = normalize_gstin(request.form['gst'])
         address = request.form['address']
         bank_name = request.form['bank_name']
         account_number = request.form['account_number']
         ifsc = request.form['ifsc']
 
-        contacts = []
-        for i in range(len(request.form.getlist('contact_name'))):
-            contacts.append({
-                'name': request.form.getlist('contact_name')[i],
-                'phone': request.form.getlist('contact_phone')[i],
-                'email': request.form.getlist('contact_email')[i],
-            })
+        # Only the shape is enforced here: GSTINs already on file may not pass
+        # the check digit, so a mismatch is flagged but still saved
+        error = gstin_format_error(gst)
+        if error:
+            flash(f"⚠️ {error}.", "warning")
+            return redirect(url_for('vendor_registration'))
+        if not gstin_checksum_matches(gst):
+            flash(f"⚠️ GSTIN {gst} does not match its check digit; please verify it.", "warning")
+
+        contacts = list(zip(request.form.getlist('contact_name'),
+                            request.form.getlist('contact_phone'),
+                            request.form.getlist('contact_email')))
 
         conn = get_db()
         cur = conn.cursor()
-        cur.execute("INSERT INTO vendors (name, gst, address, bank_name, account_number, ifsc) VALUES (?, ?, ?, ?, ?, ?)",
-                    (vendor_name, gst, address, bank_name, account_number, ifsc))
+        try:
+            cur.execute("INSERT INTO vendors (name, gst, address, bank_name, account_number, ifsc) VALUES (?, ?, ?, ?, ?, ?)",
+                        (vendor_name, gst, address, bank_name, account_number, ifsc))
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            flash(f"⚠️ A vendor with GSTIN {gst} is already registered.", "warning")
+            return redirect(url_for('vendor_registration'))
         vendor_id = cur.lastrowid
 
-        for contact in contacts:
-            cur.execute("INSERT INTO vendor_contacts (vendor_id, name, phone, email) VALUES (?, ?, ?, ?)",
-                        (vendor_id, contact['name'], contact['phone'], contact['email']))
+        cur.executemany("INSERT INTO vendor_contacts (vendor_id, name, phone, email) VALUES (?, ?, ?, ?)",
+                        [(vendor_id, name, phone, email) for name, phone, email in contacts])
 
         conn.commit()
         conn.close()
@@ -354,6 +1449,130 @@ def vendor_registration():
 
     return render_template('vendor_registration.html')
 
+
+# ---------- ✅ Vendor Import ----------
+# Bulk load of the vendor master from a .csv/.xlsx sheet. Vendors are upserted
+# by GSTIN through ux_vendors_gst; a GSTIN repeated in the sheet keeps the
+# first row's details and contributes only its contact. Contacts are added in
+# one executemany, skipping ones the vendor already has, so re-importing the
+# same sheet changes nothing.
+
+VENDOR_COLUMN_ALIASES = {
+    'name': ['name', 'vendor_name', 'vendor', 'supplier', 'supplier_name'],
+    'gst': ['gst', 'gstin', 'gst_no', 'gst_number'],
+    'address': ['address', 'vendor_address'],
+    'bank_name': ['bank_name', 'bank'],
+    'account_number': ['account_number', 'account_no', 'account'],
+    'ifsc': ['ifsc', 'ifsc_code'],
+    'contact_name': ['contact_name', 'contact', 'contact_person'],
+    'contact_phone': ['contact_phone', 'phone', 'mobile'],
+    'contact_email': ['contact_email', 'email'],
+}
+REQUIRED_VENDOR_COLUMNS = ['name', 'gst']
+VENDOR_FIELDS = ['name', 'gst', 'address', 'bank_name', 'account_number', 'ifsc']
+
+UPSERT_VENDOR_SQL = f"""
+    INSERT INTO vendors ({', '.join(VENDOR_FIELDS)}) VALUES ({', '.join('?' * len(VENDOR_FIELDS))})
+    ON CONFLICT(gst) WHERE gst IS NOT NULL DO UPDATE SET
+        name = excluded.name,
+        address = COALESCE(excluded.address, vendors.address),
+        bank_name = COALESCE(excluded.bank_name, vendors.bank_name),
+        account_number = COALESCE(excluded.account_number, vendors.account_number),
+        ifsc = COALESCE(excluded.ifsc, vendors.ifsc)
+"""
+
+INSERT_VENDOR_CONTACT_SQL = """
+    INSERT INTO vendor_contacts (vendor_id, name, phone, email)
+    SELECT :vendor_id, :name, :phone, :email
+    WHERE NOT EXISTS (
+        SELECT 1 FROM vendor_contacts
+        WHERE vendor_id = :vendor_id AND name IS :name AND phone IS :phone AND email IS :email
+    )
+"""
+
+
+def sheet_text(value):
+    text = str(value).strip() if value is not None else ''
+    return text or None
+
+
+@app.route('/vendor_import', methods=['POST'])
+def vendor_import():
+    if 'user' not in session:
+        return jsonify(status="error", message="Login required"), 401
+
+    upload = request.files.get('sheet')
+    if not upload or not upload.filename:
+        return jsonify(status="error", message="No file uploaded"), 400
+
+    vendors = {}        # gstin -> (first row number, vendor values)
+    contacts = []       # (gstin, name, phone, email)
+    invalid, duplicates = [], []
+    positions = None
+    try:
+        for line_no, cells in enumerate(iter_sheet_rows(upload), start=1):
+            if not any(str(c).strip() for c in cells if c is not None):
+                continue
+            if positions is None:
+                positions = map_sheet_header(cells, VENDOR_COLUMN_ALIASES)
+                missing = [c for c in REQUIRED_VENDOR_COLUMNS if c not in positions]
+                if missing:
+                    return jsonify(status="error", message=f"Missing columns: {', '.join(missing)}"), 400
+                continue
+
+            values = {column: sheet_text(cells[i] if i < len(cells) else None) for column, i in positions.items()}
+            gstin = normalize_gstin(values.get('gst'))
+            error = "Vendor name is required" if not values.get('name') else gstin_error(gstin)
+            if error:
+                invalid.append({"row": line_no, "gst": values.get('gst'), "error": error})
+                continue
+
+            if gstin in vendors:
+                duplicates.append({"row": line_no, "gst": gstin, "first_row": vendors[gstin][0]})
+            else:
+                vendors[gstin] = (line_no, [values.get(f) if f != 'gst' else gstin for f in VENDOR_FIELDS])
+            contact = (values.get('contact_name'), values.get('contact_phone'), values.get('contact_email'))
+            if any(contact):
+                contacts.append((gstin, *contact))
+    except ValueError as e:
+        return jsonify(status="error", message=str(e)), 400
+
+    if positions is None:
+        return jsonify(status="error", message="The sheet is empty"), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COUNT(*) FROM vendors")
+        before = cur.fetchone()[0]
+        cur.executemany(UPSERT_VENDOR_SQL, [row for _, row in vendors.values()])
+        cur.execute("SELECT COUNT(*) FROM vendors")
+        inserted = cur.fetchone()[0] - before
+
+        vendor_ids = {}
+        gstins = list(vendors)
+        for start in range(0, len(gstins), IMPORT_BATCH_SIZE):
+            chunk = gstins[start:start + IMPORT_BATCH_SIZE]
+            cur.execute(f"SELECT id, gst FROM vendors WHERE gst IN ({', '.join('?' * len(chunk))})", chunk)
+            vendor_ids.update((row["gst"], row["id"]) for row in cur.fetchall())
+
+        cur.execute("SELECT COUNT(*) FROM vendor_contacts")
+        contacts_before = cur.fetchone()[0]
+        cur.executemany(INSERT_VENDOR_CONTACT_SQL, [
+            {"vendor_id": vendor_ids[gstin], "name": name, "phone": phone, "email": email}
+            for gstin, name, phone, email in contacts
+        ])
+        cur.execute("SELECT COUNT(*) FROM vendor_contacts")
+        contacts_added = cur.fetchone()[0] - contacts_before
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("Vendor import error:", e)
+        return jsonify(status="error", message=str(e)), 500
+
+    return jsonify(status="success", inserted=inserted, updated=len(vendors) - inserted,
+                   contacts=contacts_added, duplicates=duplicates, failed=len(invalid), errors=invalid)
+
 # ---------- ✅ API: Get Vendor Info (For Auto-Fill) ----------
 
 @app.route('/projects')
@@ -362,18 +1581,8 @@ def projects():
         conn = get_db()
         cur = conn.cursor()
 
-        # Fetch all projects with vendor name
-        cur.execute("""
-            SELECT p.*, v.name AS vendor_name 
-            FROM projects p
-            LEFT JOIN vendors v ON p.vendor_id = v.id
-            ORDER BY p.id DESC
-        """)
-        projects = cur.fetchall()
-
-        # Fetch vendors
-        cur.execute("SELECT * FROM vendors ORDER BY id DESC")
-        vendors = cur.fetchall()
+        # The project list is fetched page by page from /api/projects and
+        # vendors are looked up as the user types (/api/vendors)
 
         # Generate next Enquiry ID
         cur.execute("SELECT MAX(id) FROM projects")
@@ -381,8 +1590,6 @@ def projects():
         enquiry_id = f"VE/TN/E{str(new_id).zfill(3)}"
 
         return render_template('projects.html',
-            projects=projects,
-            vendors=[dict(v) for v in vendors],
             new_enquiry_id=enquiry_id
         )
     except Exception as e:
@@ -390,6 +1597,131 @@ def projects():
         return f"<h3>Internal Error:</h3><pre>{e}</pre>", 500
 
 
+# ---------- ✅ Project Search ----------
+# project_search is an FTS5 index over the columns people search projects by,
+# including the vendor's name. Triggers on projects and vendors keep it in
+# step. /api/projects serves the project list a page at a time, newest first,
+# so pages load it lazily instead of rendering every project.
+
+PROJECT_SEARCH_COLUMNS = ["enquiry_id", "project_name", "location", "incharge", "vendor_name"]
+PROJECT_PAGE_SIZE = 50
+PROJECT_PAGE_SIZE_MAX = 200
+PROJECT_API_FIELDS = ["id", "enquiry_id", "project_name", "vendor_name", "location", "start_date",
+                      "end_date", "incharge", "status"]
+
+
+def project_search_trigger_sql():
+    values = ("NEW.id, NEW.enquiry_id, NEW.project_name, NEW.location, NEW.incharge, "
+              "(SELECT name FROM vendors WHERE id = NEW.vendor_id)")
+    insert = f"INSERT INTO project_search (rowid, {', '.join(PROJECT_SEARCH_COLUMNS)}) VALUES ({values});"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_projects_search_insert AFTER INSERT ON projects BEGIN
+            {insert}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_projects_search_update AFTER UPDATE ON projects BEGIN
+            DELETE FROM project_search WHERE rowid = OLD.id;
+            {insert}
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_projects_search_delete AFTER DELETE ON projects BEGIN
+            DELETE FROM project_search WHERE rowid = OLD.id;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_vendors_search_update AFTER UPDATE OF name ON vendors BEGIN
+            UPDATE project_search SET vendor_name = NEW.name
+            WHERE rowid IN (SELECT id FROM projects WHERE vendor_id = NEW.id);
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_vendors_search_delete AFTER DELETE ON vendors BEGIN
+            UPDATE project_search SET vendor_name = NULL
+            WHERE rowid IN (SELECT id FROM projects WHERE vendor_id = OLD.id);
+            END""",
+    ]
+
+
+def rebuild_project_search(cur):
+    cur.execute("DELETE FROM project_search")
+    cur.execute(f"""
+        INSERT INTO project_search (rowid, {', '.join(PROJECT_SEARCH_COLUMNS)})
+        SELECT p.id, p.enquiry_id, p.project_name, p.location, p.incharge, v.name
+        FROM projects p
+        LEFT JOIN vendors v ON v.id = p.vendor_id
+    """)
+
+
+def project_match_query(text):
+    """FTS5 query matching every word of `text` as a prefix, e.g. 've e01' -> '"ve"* "e01"*'."""
+    words = re.findall(r"[^\W_]+", text or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def project_page_sql(limit, match=None, status=None, date_from=None, date_to=None, before_id=None):
+    """SQL + params for one page of the project list, newest first."""
+    where, params = [], []
+    if match:
+        where.append("p.id IN (SELECT rowid FROM project_search WHERE project_search MATCH ?)")
+        params.append(match)
+    if status:
+        where.append("COALESCE(NULLIF(p.status, ''), 'new') = ?")
+        params.append(status)
+    if date_from:
+        where.append("p.start_date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("p.start_date <= ?")
+        params.append(date_to)
+    if before_id is not None:
+        where.append("p.id < ?")
+        params.append(before_id)
+
+    sql = f"""
+        SELECT p.id, p.enquiry_id, p.project_name, v.name AS vendor_name, p.location, p.start_date,
+               p.end_date, p.incharge, p.status
+        FROM projects p
+        LEFT JOIN vendors v ON v.id = p.vendor_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY p.id DESC
+        LIMIT ?
+    """
+    return sql, params + [limit]
+
+
+@app.route('/api/projects')
+def api_projects():
+    limit = min(max(request.args.get('limit', PROJECT_PAGE_SIZE, type=int), 1), PROJECT_PAGE_SIZE_MAX)
+
+    before_id = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        if not isinstance(position, list) or len(position) != 1:
+            return jsonify(status="error", message="Invalid cursor"), 400
+        before_id = position[0]
+
+    sql, params = project_page_sql(limit + 1, match=project_match_query(request.args.get('q')),
+                                   status=request.args.get('status'), date_from=request.args.get('date_from'),
+                                   date_to=request.args.get('date_to'), before_id=before_id)
+    cur = get_db().cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+
+    projects = []
+    for row in rows[:limit]:
+        project = {field: row[field] for field in PROJECT_API_FIELDS}
+        project["url"] = url_for('open_project', project_id=row["id"])
+        project["sheet_url"] = url_for('measurement_sheet', project_id=row["id"])
+        projects.append(project)
+
+    next_cursor = encode_cursor([rows[limit - 1]["id"]]) if len(rows) > limit else None
+    return jsonify(status="success", projects=projects, next_cursor=next_cursor)
+
+
+@app.cli.command("rebuild-search")
+def rebuild_search_command():
+    """Recompute the project full-text search index."""
+    conn = get_db()
+    rebuild_project_search(conn.cursor())
+    conn.commit()
+    print("✅ Project search index rebuilt.")
+
+
 @app.route('/project/delete/<int:project_id>', methods=['POST'])
 def delete_project(project_id):
     try:
@@ -465,15 +1797,79 @@ def create_project():
         return f"An error occurred: {e}", 500
 
 
+# ---------- ✅ API: Vendor Typeahead ----------
+# Project forms look vendors up as the user types instead of receiving the
+# whole vendor master. Results are cached per (vendors data version, prefix,
+# limit), so a write from any worker makes every worker's cached answers stale.
+
+VENDOR_SEARCH_LIMIT = 20
+VENDOR_SEARCH_LIMIT_MAX = 100
+VENDOR_CACHE_TTL = 300
+
+_vendor_cache = TTLCache(VENDOR_CACHE_TTL, maxsize=512)
+
+VENDOR_LOOKUP_SQL = """
+    SELECT v.id, v.name, v.gst, v.address,
+           c.name AS contact_name, c.phone AS contact_phone, c.email AS contact_email
+    FROM vendors v
+    LEFT JOIN vendor_contacts c
+           ON c.id = (SELECT MIN(id) FROM vendor_contacts WHERE vendor_id = v.id)
+"""
+
+
+def vendor_payload(row):
+    """A vendor with its first registered contact as the primary one."""
+    contact = None
+    if row["contact_name"] or row["contact_phone"] or row["contact_email"]:
+        contact = {"name": row["contact_name"], "phone": row["contact_phone"], "email": row["contact_email"]}
+    return {"id": row["id"], "name": row["name"], "gst": row["gst"], "address": row["address"],
+            "contact": contact}
+
+
+def vendor_search_sql(prefix, limit):
+    """SQL + params for vendors whose name starts with a lowercase `prefix`."""
+    where, params = "", []
+    if prefix:
+        # A range on the NOCASE name index; LIKE 'x%' would not use it here.
+        # NOCASE compares lowercased, so the bound is built from the lowercase
+        # prefix ('z' -> '{', not 'Z' -> '[' which sorts below the letters).
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        where = "WHERE v.name >= ? COLLATE NOCASE AND v.name < ? COLLATE NOCASE"
+        params = [prefix, upper]
+    return f"{VENDOR_LOOKUP_SQL} {where} ORDER BY v.name COLLATE NOCASE LIMIT ?", params + [limit]
+
+
+def search_vendors(prefix, limit):
+    """Vendors whose name starts with `prefix` (case-insensitive), by name."""
+    prefix = prefix.lower()
+    cur = get_db().cursor()
+    key = (data_version(cur, "vendors"), prefix, limit)
+    vendors = _vendor_cache.get(key)
+    if vendors is not None:
+        return vendors
+
+    cur.execute(*vendor_search_sql(prefix, limit))
+    vendors = [vendor_payload(row) for row in cur.fetchall()]
+    _vendor_cache.set(key, vendors)
+    return vendors
+
+
+@app.route('/api/vendors')
+def api_vendors():
+    limit = min(max(request.args.get('limit', VENDOR_SEARCH_LIMIT, type=int), 1), VENDOR_SEARCH_LIMIT_MAX)
+    prefix = (request.args.get('q') or '').strip()
+    return jsonify(status="success", vendors=search_vendors(prefix, limit))
+
 
 @app.route('/vendor/<int:vendor_id>')
 def get_vendor_details(vendor_id):
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("SELECT gst, address FROM vendors WHERE id = ?", (vendor_id,))
+    cur.execute(f"{VENDOR_LOOKUP_SQL} WHERE v.id = ?", (vendor_id,))
     vendor = cur.fetchone()
     if vendor:
-        return jsonify(gst=vendor['gst'], address=vendor['address'])
+        vendor = vendor_payload(vendor)
+        return jsonify(gst=vendor['gst'], address=vendor['address'], contact=vendor['contact'])
     return jsonify(error="Vendor not found"), 404
 
 
@@ -511,119 +1907,178 @@ def add_measurement():
 
 @app.route('/measurement_sheet/<int:project_id>', methods=['GET', 'POST'])
 def show_measurement_sheet(project_id):
-    project = Project.query.get(project_id)
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM projects WHERE id = ?", (project_id,))
+    project = cur.fetchone()
+    if not project:
+        return "Project not found", 404
 
     if request.method == 'POST':
-        # Loop over the posted arrays
-        for i in range(len(request.form.getlist('duct_no[]'))):
-            entry = Measurement(
-                project_id=project_id,
-                duct_no=request.form.getlist('duct_no[]')[i],
-                duct_type=request.form.getlist('duct_type[]')[i],
-                w1=request.form.getlist('w1[]')[i],
-                h1=request.form.getlist('h1[]')[i],
-                w2=request.form.getlist('w2[]')[i],
-                h2=request.form.getlist('h2[]')[i],
-                qty=request.form.getlist('qty[]')[i],
-                length=request.form.getlist('length[]')[i],
-                deg=request.form.getlist('deg[]')[i],
-                factor=request.form.getlist('factor[]')[i]
-            )
-            db.session.add(entry)
-        db.session.commit()
+        columns = {
+            'duct_no': 'duct_no[]', 'duct_type': 'duct_type[]',
+            'width1': 'w1[]', 'height1': 'h1[]', 'width2': 'w2[]', 'height2': 'h2[]',
+            'quantity': 'qty[]', 'length_or_radius': 'length[]',
+            'degree_or_offset': 'deg[]', 'factor': 'factor[]',
+        }
+        posted = {column: request.form.getlist(field) for column, field in columns.items()}
+        rows, errors = [], []
+        for i in range(len(posted['duct_no'])):
+            row, error = validate_measurement_row(
+                {column: values[i] if i < len(values) else None for column, values in posted.items()})
+            if error:
+                errors.append(f"Row {i + 1}: {error}")
+            else:
+                rows.append(row)
+
+        insert_duct_rows(conn, project_id, rows)
+        conn.commit()
+        for error in errors:
+            flash(f"⚠️ {error}", "warning")
+        flash(f"✅ {len(rows)} measurement(s) saved", "success")
         return redirect(f'/measurement_sheet/{project_id}')
 
     return render_template('measurement_sheet.html', project=project)
 
 # ---------- ✅ Open Specific Project and Duct Entries ----------
+PROJECT_WITH_VENDOR_SQL = """
+    SELECT p.*, v.name as vendor_name
+    FROM projects p
+    LEFT JOIN vendors v ON p.vendor_id = v.id
+    WHERE p.id = ?
+"""
+
+
 @app.route('/project/<int:project_id>')
 def open_project(project_id):
     conn = get_db()
     cur = conn.cursor()
 
     # ✅ Get selected project with vendor name
-    cur.execute("""
-        SELECT p.*, v.name as vendor_name
-        FROM projects p
-        LEFT JOIN vendors v ON p.vendor_id = v.id
-        WHERE p.id = ?
-    """, (project_id,))
+    cur.execute(PROJECT_WITH_VENDOR_SQL, (project_id,))
     project = cur.fetchone()
 
     if not project:
         flash("Project not found.", "danger")
         return redirect(url_for('projects'))
 
-    # ✅ All projects for the left-side list
-    cur.execute("""
-        SELECT p.*, v.name as vendor_name
-        FROM projects p
-        LEFT JOIN vendors v ON p.vendor_id = v.id
-        ORDER BY p.id DESC
-    """)
-    projects = cur.fetchall()
+    # ✅ The project list is loaded lazily from /api/projects
 
-    # ✅ All vendors for dropdown
-    cur.execute("SELECT * FROM vendors")
-    vendors = cur.fetchall()
+    # ✅ Duct rows are loaded page by page from /api/project/<id>/ducts
 
-    # ✅ Duct entries linked to this project
-    cur.execute("SELECT * FROM duct_entries WHERE project_id = ?", (project_id,))
-    duct_rows = cur.fetchall()
-
-    # ✅ Totals calculation
-    ducts = []
-    total_area = total_nuts = total_cleat = total_gasket = total_corner = total_weight = 0.0
-    gauge_area_totals = {"24G": 0.0, "22G": 0.0, "20G": 0.0, "18G": 0.0}
-
-    for row in duct_rows:
-        d = dict(row)
-        area = float(d.get('area') or 0)
-        nuts = float(d.get('nuts_bolts') or 0)
-        cleat = float(d.get('cleat') or 0)
-        gasket = float(d.get('gasket') or 0)
-        corner = float(d.get('corner_pieces') or 0)
-        weight = float(d.get('weight') or 0)
-        gauge = (d.get('gauge') or '').strip()
-
-        # Totals
-        total_area += area
-        total_nuts += nuts
-        total_cleat += cleat
-        total_gasket += gasket
-        total_corner += corner
-        total_weight += weight
-
-        # Area by gauge
-        if gauge in gauge_area_totals:
-            gauge_area_totals[gauge] += area
-
-        # Add parsed values to row
-        d.update({
-            'area': area,
-            'nuts_bolts': nuts,
-            'cleat': cleat,
-            'gasket': gasket,
-            'corner_pieces': corner,
-            'weight': weight
-        })
-        ducts.append(d)
+    # ✅ Totals come from the materialized project_totals row
+    totals = get_project_totals(cur, project_id)
+    gauge_area_totals = {g.upper(): totals[f"area_{g}"] for g in ("24g", "22g", "20g", "18g")}
 
     conn.close()
 
     return render_template("projects.html",
                            project=project,
-                           projects=projects,
-                           vendors=vendors,
-                           ducts=ducts,
-                           total_area=round(total_area, 2),
-                           total_nuts=round(total_nuts, 2),
-                           total_cleat=round(total_cleat, 2),
-                           total_gasket=round(total_gasket, 2),
-                           total_corner=round(total_corner, 2),
-                           total_weight=round(total_weight, 2),
+                           total_area=totals["total_area"],
+                           total_nuts=totals["total_nuts"],
+                           total_cleat=totals["total_cleat"],
+                           total_gasket=totals["total_gasket"],
+                           total_corner=totals["total_corner"],
+                           total_weight=totals["total_weight"],
                            gauge_area_totals=gauge_area_totals)
 
+# ---------- ✅ API: Duct Entries (Paginated) ----------
+
+DUCT_SORT_COLUMNS = {"duct_no": "duct_no", "type": "duct_type", "gauge": "gauge", "area": "area"}
+DUCT_PAGE_SIZE = 100
+DUCT_PAGE_SIZE_MAX = 500
+DUCT_API_FIELDS = ["id", "duct_no", "duct_type", "width1", "height1", "width2", "height2",
+                   "quantity", "length_or_radius", "degree_or_offset", "factor", "gauge",
+                   "area", "nuts_bolts", "cleat", "gasket", "corner_pieces", "weight"]
+DUCT_NUMERIC_FIELDS = ["area", "nuts_bolts", "cleat", "gasket", "corner_pieces", "weight"]
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_predicate(column, descending, last_value, last_id):
+    """SQL + params selecting rows after (last_value, last_id) in
+    ORDER BY column, id (ASC or DESC). SQLite sorts NULLs first ascending."""
+    if descending:
+        if last_value is None:
+            return f"({column} IS NULL AND id < ?)", [last_id]
+        return f"({column} < ? OR ({column} = ? AND id < ?) OR {column} IS NULL)", [last_value, last_value, last_id]
+    if last_value is None:
+        return f"(({column} IS NULL AND id > ?) OR {column} IS NOT NULL)", [last_id]
+    return f"({column} > ? OR ({column} = ? AND id > ?))", [last_value, last_value, last_id]
+
+
+def duct_page_sql(project_id, column, descending, limit, duct_type=None, gauge=None, position=None):
+    """SQL + params for one page of a project's ducts ordered by `column`, id;
+    `position` is the (value, id) of the last row of the previous page."""
+    where = ["project_id = ?"]
+    params = [project_id]
+    if duct_type:
+        where.append("duct_type = ?")
+        params.append(duct_type)
+    if gauge:
+        where.append("gauge = ?")
+        params.append(gauge)
+    if position:
+        clause, clause_params = keyset_predicate(column, descending, *position)
+        where.append(clause)
+        params.extend(clause_params)
+
+    direction = "DESC" if descending else "ASC"
+    sql = f"""
+        SELECT {', '.join(DUCT_API_FIELDS)} FROM duct_entries
+        WHERE {' AND '.join(where)}
+        ORDER BY {column} {direction}, id {direction}
+        LIMIT ?
+    """
+    return sql, params + [limit]
+
+
+@app.route('/api/project/<int:project_id>/ducts')
+def api_project_ducts(project_id):
+    sort = request.args.get('sort', 'duct_no')
+    if sort not in DUCT_SORT_COLUMNS:
+        return jsonify(status="error", message=f"Cannot sort by '{sort}'"), 400
+    column = DUCT_SORT_COLUMNS[sort]
+    descending = request.args.get('order', 'asc').lower() == 'desc'
+    limit = min(max(request.args.get('limit', DUCT_PAGE_SIZE, type=int), 1), DUCT_PAGE_SIZE_MAX)
+
+    position = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        if not isinstance(position, list) or len(position) != 2:
+            return jsonify(status="error", message="Invalid cursor"), 400
+
+    sql, params = duct_page_sql(project_id, column, descending, limit + 1,
+                                duct_type=(request.args.get('type') or '').upper(),
+                                gauge=(request.args.get('gauge') or '').lower(), position=position)
+    cur = get_db().cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+
+    ducts = []
+    for row in rows[:limit]:
+        d = dict(row)
+        for key in DUCT_NUMERIC_FIELDS:
+            d[key] = float(d[key] or 0)
+        ducts.append(d)
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor([last[column], last["id"]])
+    return jsonify(status="success", ducts=ducts, next_cursor=next_cursor)
+
+
 @app.route('/project/<int:project_id>/measurement_sheet')
 def measurement_sheet(project_id):
     conn = get_db()
@@ -639,57 +2094,27 @@ def measurement_sheet(project_id):
 
 # ---------- ✅ Add Duct Entry ----------
 
+def read_duct_form(form):
+    """Parse the measured (non-derived) duct fields from an entry form."""
+    return {
+        "duct_no": form.get("duct_no", ""),
+        "duct_type": (form.get("duct_type") or "").upper(),
+        "width1": float(form.get("width1") or 0),
+        "height1": float(form.get("height1") or 0),
+        "width2": float(form.get("width2") or 0),
+        "height2": float(form.get("height2") or 0),
+        "quantity": int(form.get("quantity") or 0),
+        "length_or_radius": float(form.get("length_or_radius") or 0),
+        "degree_or_offset": float(form.get("degree_or_offset") or 0),
+        "factor": float(form.get("factor") or 1.0),
+    }
+
+
 @app.route('/add_duct', methods=['POST'])
 def add_duct():
-    import math
     project_id = request.form['project_id']
-    duct_no = request.form['duct_no']
-    duct_type = request.form['duct_type'].upper()
-    w1 = float(request.form.get('width1') or 0)
-    h1 = float(request.form.get('height1') or 0)
-    w2 = float(request.form.get('width2') or 0)
-    h2 = float(request.form.get('height2') or 0)
-    qty = int(request.form.get('quantity') or 0)
-    length = float(request.form.get('length_or_radius') or 0)
-    deg = float(request.form.get('degree_or_offset') or 0)
-    factor = float(request.form.get('factor') or 1.0)
-
-    # 🧮 Area calculation
-    area = 0
-    if duct_type == 'ST':
-        area = 2 * (w1 + h1) / 1000 * (length / 1000) * qty
-    elif duct_type == 'RED':
-        area = (w1 + h1 + w2 + h2) / 1000 * (length / 1000) * qty * factor
-    elif duct_type == 'DUM':
-        area = (w1 * h1) / 1000000 * qty
-    elif duct_type == 'OFFSET':
-        area = (w1 + h1 + w2 + h2) / 1000 * ((length + deg) / 1000) * qty * factor
-    elif duct_type == 'SHOE':
-        area = (w1 + h1) * 2 / 1000 * (length / 1000) * qty * factor
-    elif duct_type == 'VANES':
-        area = w1 / 1000 * (2 * math.pi * (w1 / 1000) / 4) * qty
-    elif duct_type == 'ELB':
-        area = 2 * (w1 + h1) / 1000 * ((h1 / 2 / 1000) + (length / 1000) * (math.pi * (deg / 180))) * qty * factor
-
-    # 🧮 Determine gauge
-    gauge = '18g'
-    if w1 <= 751 and h1 <= 751:
-        gauge = '24g'
-    elif w1 <= 1201 and h1 <= 1201:
-        gauge = '22g'
-    elif w1 <= 1800 and h1 <= 1800:
-        gauge = '20g'
-
-    # 🧮 Material calculations
-    nuts_bolts = qty * 4
-    cleat_factor = {'24g': 4, '22g': 8, '20g': 10}.get(gauge, 12)
-    cleat = qty * cleat_factor
-    gasket = (w1 + h1 + w2 + h2) / 1000 * qty
-    corner_pieces = 0 if duct_type == 'DUM' else qty * 8
-
-    # 🧮 Weight (example values per m²)
-    weight_per_m2 = {'24g': 4.0, '22g': 5.0, '20g': 6.0, '18g': 7.5}
-    weight = area * weight_per_m2.get(gauge, 7.5)
+    duct = read_duct_form(request.form)
+    duct.update(calculate_duct(**{k: duct[k] for k in DUCT_INPUT_COLUMNS}))
 
     # ✅ Insert to DB
     conn = get_db()
@@ -699,13 +2124,12 @@ def add_duct():
             project_id, duct_no, duct_type, width1, height1, width2, height2,
             quantity, length_or_radius, degree_or_offset, factor,
             area, gauge, nuts_bolts, cleat, gasket, corner_pieces, weight
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        project_id, duct_no, duct_type, w1, h1, w2, h2,
-        qty, length, deg, factor,
-        round(area, 2), gauge, round(nuts_bolts, 2), round(cleat, 2),
-        round(gasket, 2), round(corner_pieces, 2), round(weight, 2)
-    ))
+        ) VALUES (
+            :project_id, :duct_no, :duct_type, :width1, :height1, :width2, :height2,
+            :quantity, :length_or_radius, :degree_or_offset, :factor,
+            :area, :gauge, :nuts_bolts, :cleat, :gasket, :corner_pieces, :weight
+        )
+    ''', {**duct, "project_id": project_id})
     conn.commit()
     conn.close()
 
@@ -714,6 +2138,28 @@ def add_duct():
 
 # ---------- ✅ Edit Duct Entry ----------
 
+UPDATE_DUCT_SQL = """
+    UPDATE duct_entries SET
+        duct_no = :duct_no,
+        duct_type = :duct_type,
+        width1 = :width1,
+        height1 = :height1,
+        width2 = :width2,
+        height2 = :height2,
+        length_or_radius = :length_or_radius,
+        degree_or_offset = :degree_or_offset,
+        quantity = :quantity,
+        factor = :factor,
+        area = :area,
+        gauge = :gauge,
+        nuts_bolts = :nuts_bolts,
+        cleat = :cleat,
+        gasket = :gasket,
+        corner_pieces = :corner_pieces,
+        weight = :weight
+    WHERE id = :entry_id
+"""
+
 @app.route("/edit_duct/<int:entry_id>", methods=["GET", "POST"])
 def get_entry(entry_id):
     conn = get_db()
@@ -731,46 +2177,12 @@ def get_entry(entry_id):
 
     # 📝 Form Submission
     if request.method == "POST":
-        data = {
-            "duct_no": request.form.get("duct_no"),
-            "duct_type": request.form.get("duct_type"),
-            "width1": request.form.get("width1"),
-            "height1": request.form.get("height1"),
-            "width2": request.form.get("width2"),
-            "height2": request.form.get("height2"),
-            "length_or_radius": request.form.get("length_or_radius"),
-            "degree_or_offset": request.form.get("degree_or_offset"),
-            "quantity": request.form.get("quantity"),
-            "gauge": request.form.get("gauge"),
-            "factor": request.form.get("factor"),
-            "area": request.form.get("area"),
-            "nuts_bolts": request.form.get("nuts_bolts"),
-            "cleat": request.form.get("cleat"),
-            "gasket": request.form.get("gasket"),
-            "corner_pieces": request.form.get("corner_pieces")
-        }
+        # Derived quantities are recomputed server-side, never taken from the form
+        duct = read_duct_form(request.form)
+        duct.update(calculate_duct(**{k: duct[k] for k in DUCT_INPUT_COLUMNS}))
 
         # ✅ Update the duct entry
-        cur.execute("""
-            UPDATE duct_entries SET
-                duct_no = :duct_no,
-                duct_type = :duct_type,
-                width1 = :width1,
-                height1 = :height1,
-                width2 = :width2,
-                height2 = :height2,
-                length_or_radius = :length_or_radius,
-                degree_or_offset = :degree_or_offset,
-                quantity = :quantity,
-                gauge = :gauge,
-                factor = :factor,
-                area = :area,
-                nuts_bolts = :nuts_bolts,
-                cleat = :cleat,
-                gasket = :gasket,
-                corner_pieces = :corner_pieces
-            WHERE id = :entry_id
-        """, {**data, "entry_id": entry_id})
+        cur.execute(UPDATE_DUCT_SQL, {**duct, "entry_id": entry_id})
 
         conn.commit()
         conn.close()
@@ -781,40 +2193,25 @@ def get_entry(entry_id):
     cur.execute("SELECT * FROM projects WHERE id = ?", (project_id,))
     project = cur.fetchone()
 
-    cur.execute("SELECT * FROM vendors")
-    vendors = cur.fetchall()
-
-    cur.execute("SELECT * FROM duct_entries WHERE project_id = ?", (project_id,))
-    entries = cur.fetchall()
-
     # 📊 Totals
-    def safe_float(val): return float(val or 0)
-
-    total_area = sum(safe_float(d['area']) for d in entries)
-    total_nuts = sum(safe_float(d['nuts_bolts']) for d in entries)
-    total_cleat = sum(safe_float(d['cleat']) for d in entries)
-    total_gasket = sum(safe_float(d['gasket']) for d in entries)
-    total_corner = sum(safe_float(d['corner_pieces']) for d in entries)
+    totals = get_project_totals(cur, project_id)
 
     conn.close()
 
     # 📤 Render with pre-filled edit form
     return render_template("projects.html",
                            project=project,
-                           vendors=vendors,
-                           entries=entries,
                            edit_entry=entry,
-                           total_area=round(total_area, 2),
-                           total_nuts=round(total_nuts, 2),
-                           total_cleat=round(total_cleat, 2),
-                           total_gasket=round(total_gasket, 2),
-                           total_corner=round(total_corner, 2))
+                           total_area=totals["total_area"],
+                           total_nuts=totals["total_nuts"],
+                           total_cleat=totals["total_cleat"],
+                           total_gasket=totals["total_gasket"],
+                           total_corner=totals["total_corner"])
 
 # ---------- ✅ Update Duct Entry (Recalculate Area) ----------
 
 @app.route("/update_duct/<int:entry_id>", methods=["POST"])
 def update_duct(entry_id):
-    import math
     conn = get_db()
     cur = conn.cursor()
 
@@ -826,76 +2223,218 @@ def update_duct(entry_id):
         return redirect(url_for("projects"))
     project_id = row[0]
 
-    # Read updated values
-    duct_no = request.form["duct_no"]
-    duct_type = request.form["duct_type"].upper()
-    w1 = float(request.form.get("width1") or 0)
-    h1 = float(request.form.get("height1") or 0)
-    w2 = float(request.form.get("width2") or 0)
-    h2 = float(request.form.get("height2") or 0)
-    qty = int(request.form.get("quantity") or 0)
-    length = float(request.form.get("length_or_radius") or 0)
-    deg = float(request.form.get("degree_or_offset") or 0)
-    factor = float(request.form.get("factor") or 1.0)
-
-    # Recalculate area
-    area = 0
-    if duct_type == 'ST':
-        area = 2 * (w1 + h1) / 1000 * (length / 1000) * qty
-    elif duct_type == 'RED':
-        area = (w1 + h1 + w2 + h2) / 1000 * (length / 1000) * qty * factor
-    elif duct_type == 'DUM':
-        area = (w1 * h1) / 1000000 * qty
-    elif duct_type == 'OFFSET':
-        area = (w1 + h1 + w2 + h2) / 1000 * ((length + deg) / 1000) * qty * factor
-    elif duct_type == 'SHOE':
-        area = (w1 + h1) * 2 / 1000 * (length / 1000) * qty * factor
-    elif duct_type == 'VANES':
-        area = w1 / 1000 * (2 * math.pi * (w1 / 1000) / 4) * qty
-    elif duct_type == 'ELB':
-        area = 2 * (w1 + h1) / 1000 * ((h1 / 2 / 1000) + (length / 1000) * (math.pi * (deg / 180))) * qty * factor
-
-    # Determine gauge
-    gauge = '18g'
-    if w1 <= 751 and h1 <= 751:
-        gauge = '24g'
-    elif w1 <= 1201 and h1 <= 1201:
-        gauge = '22g'
-    elif w1 <= 1800 and h1 <= 1800:
-        gauge = '20g'
-
-    nuts_bolts = qty * 4
-    cleat_factor = 12
-    if gauge == '24g':
-        cleat_factor = 4
-    elif gauge == '22g':
-        cleat_factor = 8
-    elif gauge == '20g':
-        cleat_factor = 10
-    cleat = qty * cleat_factor
-    gasket = (w1 + h1 + w2 + h2) / 1000 * qty
-    corner_pieces = 0 if duct_type == 'DUM' else qty * 8
+    # Read updated values and recalculate
+    duct = read_duct_form(request.form)
+    duct.update(calculate_duct(**{k: duct[k] for k in DUCT_INPUT_COLUMNS}))
 
     # Update record
-    cur.execute("""
-        UPDATE duct_entries SET
-            duct_no = ?, duct_type = ?, width1 = ?, height1 = ?, width2 = ?, height2 = ?,
-            quantity = ?, length_or_radius = ?, degree_or_offset = ?, factor = ?,
-            area = ?, gauge = ?, nuts_bolts = ?, cleat = ?, gasket = ?, corner_pieces = ?
-        WHERE id = ?
-    """, (
-        duct_no, duct_type, w1, h1, w2, h2,
-        qty, length, deg, factor,
-        round(area, 2), gauge, round(nuts_bolts, 2), round(cleat, 2),
-        round(gasket, 2), round(corner_pieces, 2),
-        entry_id
-    ))
+    cur.execute(UPDATE_DUCT_SQL, {**duct, "entry_id": entry_id})
     conn.commit()
     conn.close()
 
     flash("✅ Duct entry updated", "success")
     return redirect(url_for("open_project", project_id=project_id))
 
+# ---------- ✅ Recompute Duct Entries (Batch) ----------
+
+def recompute_duct_entries(conn, project_id=None):
+    """Re-derive area, gauge and materials for every duct of a project (or all
+    projects) in one vectorized pass. Returns the number of rows updated."""
+    query = "SELECT id, " + ", ".join(DUCT_INPUT_COLUMNS) + " FROM duct_entries"
+    params = ()
+    if project_id is not None:
+        query += " WHERE project_id = ?"
+        params = (project_id,)
+    df = pd.read_sql_query(query, conn, params=params)
+    if df.empty:
+        return 0
+
+    derived = calculate_ducts(df)
+    rows = zip(*(derived[c].tolist() for c in DUCT_DERIVED_COLUMNS), df["id"].tolist())
+    conn.executemany(
+        "UPDATE duct_entries SET " + ", ".join(f"{c} = ?" for c in DUCT_DERIVED_COLUMNS) + " WHERE id = ?",
+        rows)
+    conn.commit()
+    return len(df)
+
+
+@app.route("/project/<int:project_id>/recompute", methods=["POST"])
+def recompute_project(project_id):
+    count = recompute_duct_entries(get_db(), project_id)
+    flash(f"✅ Recalculated {count} duct entries", "success")
+    return redirect(url_for("open_project", project_id=project_id))
+
+
+@app.cli.command("recompute-ducts")
+@click.option("--project-id", type=int, default=None, help="Only recompute this project.")
+def recompute_ducts_command(project_id):
+    """Re-derive area, gauge and materials for stored duct entries."""
+    count = recompute_duct_entries(get_db(), project_id)
+    print(f"✅ Recalculated {count} duct entries.")
+
+# ---------- ✅ Bulk Measurement Import ----------
+
+IMPORT_BATCH_SIZE = 500
+
+MEASUREMENT_COLUMN_ALIASES = {
+    'duct_no': ['duct_no', 'duct', 'ductno'],
+    'duct_type': ['duct_type', 'type'],
+    'width1': ['width1', 'w1'],
+    'height1': ['height1', 'h1'],
+    'width2': ['width2', 'w2'],
+    'height2': ['height2', 'h2'],
+    'quantity': ['quantity', 'qty'],
+    'length_or_radius': ['length_or_radius', 'length', 'len', 'radius'],
+    'degree_or_offset': ['degree_or_offset', 'degree', 'deg', 'offset'],
+    'factor': ['factor'],
+}
+REQUIRED_MEASUREMENT_COLUMNS = ['duct_no', 'duct_type', 'width1', 'height1', 'quantity']
+
+DUCT_TYPES = {'ST', 'RED', 'DUM', 'OFFSET', 'SHOE', 'VANES', 'ELB'}
+DUCT_TYPE_ALIASES = {'STRAIGHT': 'ST', 'REDUCER': 'RED', 'DUMMY': 'DUM', 'ELBOW': 'ELB'}
+
+
+def validate_measurement_row(values):
+    """Check one measurement row. Returns (row, None) or (None, error message)."""
+    duct_no = str(values.get('duct_no') or '').strip()
+    if not duct_no:
+        return None, "Duct No is required"
+
+    duct_type = str(values.get('duct_type') or '').strip().upper()
+    duct_type = DUCT_TYPE_ALIASES.get(duct_type, duct_type)
+    if duct_type not in DUCT_TYPES:
+        return None, f"Unknown duct type '{values.get('duct_type') or ''}'"
+
+    row = {'duct_no': duct_no, 'duct_type': duct_type}
+    for column in ['width1', 'height1', 'width2', 'height2', 'length_or_radius', 'degree_or_offset', 'factor']:
+        raw = values.get(column)
+        if raw is None or str(raw).strip() == '':
+            row[column] = 1.0 if column == 'factor' else 0.0
+            continue
+        try:
+            row[column] = float(raw)
+        except (TypeError, ValueError):
+            return None, f"{column} must be a number, got '{raw}'"
+        if row[column] < 0:
+            return None, f"{column} cannot be negative"
+
+    try:
+        quantity = float(values.get('quantity') or 0)
+    except (TypeError, ValueError):
+        return None, f"quantity must be a whole number, got '{values.get('quantity')}'"
+    if quantity < 1 or quantity != int(quantity):
+        return None, "quantity must be a whole number of at least 1"
+    row['quantity'] = int(quantity)
+
+    if row['width1'] <= 0:
+        return None, "width1 must be greater than 0"
+    if duct_type != 'VANES' and row['height1'] <= 0:
+        return None, "height1 must be greater than 0"
+    return row, None
+
+
+def insert_duct_rows(conn, project_id, rows):
+    """Derive quantities for validated rows in one batch and insert them.
+
+    The caller owns the transaction and commits once at the end.
+    """
+    if not rows:
+        return 0
+    df = pd.DataFrame(rows)
+    derived = calculate_ducts(df)
+    columns = ['duct_no'] + DUCT_INPUT_COLUMNS + DUCT_DERIVED_COLUMNS
+    values = zip(*([df[c].tolist() for c in ['duct_no'] + DUCT_INPUT_COLUMNS] +
+                   [derived[c].tolist() for c in DUCT_DERIVED_COLUMNS]))
+    conn.executemany(
+        f"INSERT INTO duct_entries (project_id, {', '.join(columns)}) "
+        f"VALUES (?, {', '.join('?' * len(columns))})",
+        ((project_id, *v) for v in values))
+    return len(rows)
+
+
+def iter_sheet_rows(upload):
+    """Stream the rows of an uploaded .csv or .xlsx sheet as lists."""
+    filename = (upload.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(upload.stream, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
+    elif filename.endswith('.csv'):
+        yield from csv.reader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''))
+    else:
+        raise ValueError("Upload a .csv or .xlsx sheet")
+
+
+def map_sheet_header(header, aliases):
+    """Map normalised header cells to column positions."""
+    lookup = {alias: column for column, names in aliases.items() for alias in names}
+    positions = {}
+    for i, cell in enumerate(header):
+        key = str(cell or '').strip().lower().replace(' ', '_').replace('-', '_')
+        if key in lookup and lookup[key] not in positions:
+            positions[lookup[key]] = i
+    return positions
+
+
+@app.route('/project/<int:project_id>/import_measurements', methods=['POST'])
+def import_measurements(project_id):
+    if 'user' not in session:
+        return jsonify(status="error", message="Login required"), 401
+
+    upload = request.files.get('sheet')
+    if not upload or not upload.filename:
+        return jsonify(status="error", message="No file uploaded"), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,))
+    if not cur.fetchone():
+        return jsonify(status="error", message="Project not found"), 404
+
+    errors = []
+    inserted = 0
+    batch = []
+    positions = None
+    try:
+        for line_no, cells in enumerate(iter_sheet_rows(upload), start=1):
+            if not any(str(c).strip() for c in cells if c is not None):
+                continue
+            if positions is None:
+                positions = map_sheet_header(cells, MEASUREMENT_COLUMN_ALIASES)
+                missing = [c for c in REQUIRED_MEASUREMENT_COLUMNS if c not in positions]
+                if missing:
+                    return jsonify(status="error", message=f"Missing columns: {', '.join(missing)}"), 400
+                continue
+
+            values = {column: cells[i] if i < len(cells) else None for column, i in positions.items()}
+            row, error = validate_measurement_row(values)
+            if error:
+                errors.append({"row": line_no, "duct_no": values.get('duct_no'), "error": error})
+                continue
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                inserted += insert_duct_rows(conn, project_id, batch)
+                batch = []
+
+        inserted += insert_duct_rows(conn, project_id, batch)
+        conn.commit()
+    except ValueError as e:
+        conn.rollback()
+        return jsonify(status="error", message=str(e)), 400
+    except Exception as e:
+        conn.rollback()
+        print("Measurement import error:", e)
+        return jsonify(status="error", message=str(e)), 500
+
+    if positions is None:
+        return jsonify(status="error", message="The sheet is empty"), 400
+
+    return jsonify(status="success", inserted=inserted, failed=len(errors), errors=errors)
+
 # ---------- ✅ Delete Duct Entry ----------
 
 @app.route("/delete_duct/<int:entry_id>", methods=["POST"])
@@ -918,168 +2457,254 @@ def delete_duct(entry_id):
     return redirect(url_for("open_project", project_id=project_id))
 
 # ---------- ✅ Export PDF ----------
-@app.route('/export_pdf/<int:project_id>')
-def export_pdf(project_id):
-    from flask import send_file
+# The measurement table is fetched and drawn one page at a time: each page
+# repeats the column headers and closes with a page subtotal and a running
+# grand total, and a summary page follows the last one. Only one page worth
+# of rows is ever held in memory.
+
+# Table area on each page: below the header block, above the "Page N" footer
+PDF_TABLE_TOP = 110
+PDF_TABLE_BOTTOM = 40
+PDF_HEADERS = ["Duct No", "Type", "W1", "H1", "W2", "H2", "Qty", "Len", "Deg", "Factor", "Gauge",
+               "Area", "24G", "22G", "20G", "18G", "Nuts", "Cleat", "Gasket", "Corner", "Weight"]
+PDF_FIELDS = ["duct_no", "duct_type", "width1", "height1", "width2", "height2", "quantity",
+              "length_or_radius", "degree_or_offset", "factor", "gauge", "area",
+              "nuts_bolts", "cleat", "gasket", "corner_pieces", "weight"]
+PDF_DUCT_ROWS_SQL = f"SELECT {','.join(PDF_FIELDS)} FROM duct_entries WHERE project_id = ? ORDER BY id"
+PDF_TOTAL_COLUMNS = ["Qty", "Area", "24G", "22G", "20G", "18G", "Nuts", "Cleat", "Gasket", "Corner", "Weight"]
+
+
+def pdf_number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def pdf_duct_row(d):
+    """Format one duct for the table; returns (cells, values to total)."""
+    area = pdf_number(d["area"])
+    gauge = (d["gauge"] or "").strip().upper()
+    amounts = {
+        "Qty": pdf_number(d["quantity"]),
+        "Area": area,
+        "24G": area if gauge == "24G" else 0,
+        "22G": area if gauge == "22G" else 0,
+        "20G": area if gauge == "20G" else 0,
+        "18G": area if gauge == "18G" else 0,
+        "Nuts": pdf_number(d["nuts_bolts"]),
+        "Cleat": pdf_number(d["cleat"]),
+        "Gasket": pdf_number(d["gasket"]),
+        "Corner": pdf_number(d["corner_pieces"]),
+        "Weight": pdf_number(d["weight"]),
+    }
+    cells = [
+        d["duct_no"] or "",
+        d["duct_type"] or "",
+        round(pdf_number(d["width1"]), 2),
+        round(pdf_number(d["height1"]), 2),
+        round(pdf_number(d["width2"]), 2),
+        round(pdf_number(d["height2"]), 2),
+        d["quantity"] or "",
+        round(pdf_number(d["length_or_radius"]), 2),
+        d["degree_or_offset"] or "",
+        d["factor"] or "",
+        d["gauge"] or "",
+    ] + [round(amounts[h], 2) for h in PDF_HEADERS[11:]]
+    return cells, amounts
+
+
+def pdf_total_row(label, totals):
+    row = [""] * len(PDF_HEADERS)
+    row[0] = label
+    for key in PDF_TOTAL_COLUMNS:
+        row[PDF_HEADERS.index(key)] = round(totals[key], 2)
+    return row
+
+
+def render_project_pdf(project_id, out):
+    """Write the multi-page measurement PDF for a project into `out`."""
     from reportlab.pdfgen import canvas
     from reportlab.lib.pagesizes import A4, landscape
     from reportlab.platypus import Table, TableStyle
     from reportlab.lib import colors
-    from io import BytesIO
-    import os
-    import sqlite3
 
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=landscape(A4))
     width, height = landscape(A4)
+    p = canvas.Canvas(out, pagesize=landscape(A4), pageCompression=1)
 
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-
-    # Project Info
-    c.execute("SELECT client_name, site_location FROM projects WHERE id = ?", (project_id,))
-    proj = c.fetchone()
-    client_name, site_location = proj if proj else ("", "")
+    cur = get_db().cursor()
+    cur.execute("SELECT project_name, client_name, site_location FROM projects WHERE id = ?", (project_id,))
+    proj = cur.fetchone()
+    project_name, client_name, site_location = tuple(proj) if proj else ("", "", "")
 
-    # Logo and Heading
     logo_path = os.path.join("static", "logo.png")
-    if os.path.exists(logo_path):
-        p.drawImage(logo_path, 40, height - 80, width=80, preserveAspectRatio=True)
-
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(150, height - 50, "Vanes Engineering Pvt Ltd")
-    p.setFont("Helvetica", 9)
-    p.drawString(150, height - 65, "Ducting Live Table Export")
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(40, height - 95, f"Client: {client_name}")
-    p.drawString(350, height - 95, f"Site: {site_location}")
-
-    # Headers for Live Table
-    headers = ["Duct No", "Type", "W1", "H1", "W2", "H2", "Qty", "Len", "Deg", "Factor", "Gauge",
-               "Area", "24G", "22G", "20G", "18G", "Nuts", "Cleat", "Gasket", "Corner", "Weight"]
-
-    fields = ["duct_no", "duct_type", "width1", "height1", "width2", "height2", "quantity",
-              "length_or_radius", "degree_or_offset", "factor", "gauge", "area",
-              "nuts_bolts", "cleat", "gasket", "corner_pieces", "weight"]
-
-    # Fetch duct entries
-    c.execute(f"SELECT {','.join(fields)} FROM duct_entries WHERE project_id = ?", (project_id,))
-    rows = c.fetchall()
-    conn.close()
-
-    data = [headers]
-    totals = {key: 0 for key in ["area", "24G", "22G", "20G", "18G", "quantity", "weight"]}
-
-    for row in rows:
-        row_dict = dict(zip(fields, row))
-        area = row_dict.get("area", 0) or 0
-        gauge = (row_dict.get("gauge") or "").strip()
-
-        # Gauge-specific area split
-        g24 = area if gauge == "24G" else 0
-        g22 = area if gauge == "22G" else 0
-        g20 = area if gauge == "20G" else 0
-        g18 = area if gauge == "18G" else 0
-
-        # Format each row
-        formatted_row = [
-            row_dict.get("duct_no", ""),
-            row_dict.get("duct_type", ""),
-            round(row_dict.get("width1", 0), 2),
-            round(row_dict.get("height1", 0), 2),
-            round(row_dict.get("width2", 0), 2),
-            round(row_dict.get("height2", 0), 2),
-            row_dict.get("quantity", ""),
-            round(row_dict.get("length_or_radius", 0), 2),
-            row_dict.get("degree_or_offset", ""),
-            row_dict.get("factor", ""),
-            row_dict.get("gauge", ""),
-            round(area, 2),
-            round(g24, 2),
-            round(g22, 2),
-            round(g20, 2),
-            round(g18, 2),
-            row_dict.get("nuts_bolts", ""),
-            row_dict.get("cleat", ""),
-            row_dict.get("gasket", ""),
-            row_dict.get("corner_pieces", ""),
-            round(row_dict.get("weight", 0), 2),
-        ]
-
-        # Accumulate totals
-        totals["quantity"] += row_dict.get("quantity", 0) or 0
-        totals["area"] += area
-        totals["24G"] += g24
-        totals["22G"] += g22
-        totals["20G"] += g20
-        totals["18G"] += g18
-        totals["weight"] += row_dict.get("weight", 0) or 0
-
-        data.append(formatted_row)
-
-    # Final Total Row
-    total_row = [""] * len(headers)
-    total_row[headers.index("H1")] = "Total"
-    for key in totals:
-        if key in headers:
-            total_row[headers.index(key)] = round(totals[key], 2)
-    data.append(total_row)
-
-    # Draw the table
-    table = Table(data, repeatRows=1, colWidths=[45] * len(headers))
-    table.setStyle(TableStyle([
+    page_no = 0
+
+    def draw_page_header(title):
+        nonlocal page_no
+        page_no += 1
+        if os.path.exists(logo_path):
+            p.drawImage(logo_path, 40, height - 80, width=80, preserveAspectRatio=True)
+        p.setFont("Helvetica-Bold", 16)
+        p.drawString(150, height - 50, "Vanes Engineering Pvt Ltd")
+        p.setFont("Helvetica", 9)
+        p.drawString(150, height - 65, title)
+        p.setFont("Helvetica-Bold", 10)
+        p.drawString(40, height - 95, f"Client: {client_name or ''}")
+        p.drawString(350, height - 95, f"Site: {site_location or ''}")
+        p.setFont("Helvetica", 8)
+        p.drawRightString(width - 40, height - 50, f"{project_name or ''}")
+        p.drawRightString(width - 40, 25, f"Page {page_no}")
+
+    table_style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
         ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -2), (-1, -1), colors.whitesmoke),
         ('FONTSIZE', (0, 0), (-1, -1), 6),
+        ('LEADING', (0, 0), (-1, -1), 7),
+        ('TOPPADDING', (0, 0), (-1, -1), 1.5),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1.5),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ])
+    col_width = (width - 80) / len(PDF_HEADERS)
+
+    # Rows per page from the measured row height: header + rows + two total rows
+    probe = Table([PDF_HEADERS], colWidths=[col_width] * len(PDF_HEADERS))
+    probe.setStyle(table_style)
+    _, row_height = probe.wrapOn(p, width, height)
+    rows_per_page = int((height - PDF_TABLE_TOP - PDF_TABLE_BOTTOM) // row_height) - 3
+
+    grand = dict.fromkeys(PDF_TOTAL_COLUMNS, 0.0)
+    duct_count = 0
+
+    cur.execute(PDF_DUCT_ROWS_SQL, (project_id,))
+    for rows in iter(lambda: cur.fetchmany(rows_per_page), []):
+        draw_page_header("Ducting Live Table Export")
+
+        data = [PDF_HEADERS]
+        subtotal = dict.fromkeys(PDF_TOTAL_COLUMNS, 0.0)
+        for row in rows:
+            cells, amounts = pdf_duct_row(row)
+            data.append(cells)
+            for key in PDF_TOTAL_COLUMNS:
+                subtotal[key] += amounts[key]
+        for key in PDF_TOTAL_COLUMNS:
+            grand[key] += subtotal[key]
+        duct_count += len(rows)
+
+        data.append(pdf_total_row("Page Total", subtotal))
+        data.append(pdf_total_row("Running Total", grand))
+
+        table = Table(data, colWidths=[col_width] * len(PDF_HEADERS))
+        table.setStyle(table_style)
+        _, table_height = table.wrapOn(p, width, height)
+        table.drawOn(p, 40, height - PDF_TABLE_TOP - table_height)
+        p.showPage()
+
+    # Summary page: built from the grand totals, whatever the page count
+    draw_page_header("Measurement Summary")
+    summary = [["Description", "Value"],
+               ["Duct Entries", duct_count],
+               ["Total Quantity", round(grand["Qty"], 2)]]
+    summary += [[f"Area {g} (sq.m)", round(grand[g], 2)] for g in ("24G", "22G", "20G", "18G")]
+    summary += [["Total Area (sq.m)", round(grand["Area"], 2)],
+                ["Nuts & Bolts", round(grand["Nuts"], 2)],
+                ["Cleat", round(grand["Cleat"], 2)],
+                ["Gasket (m)", round(grand["Gasket"], 2)],
+                ["Corner Pieces", round(grand["Corner"], 2)],
+                ["Weight (kg)", round(grand["Weight"], 2)]]
+    table = Table(summary, colWidths=[200, 150])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
     ]))
-
-    table.wrapOn(p, width, height)
-    table_height = 12 * len(data)
+    _, table_height = table.wrapOn(p, width, height)
     table.drawOn(p, 40, height - 130 - table_height)
 
     # Footer for signatures
     p.setFont("Helvetica", 9)
-    p.drawString(40, 40, "Engineer Signature: __________________")
-    p.drawString(350, 40, "Client Signature: __________________")
-
+    p.drawString(40, 60, "Engineer Signature: __________________")
+    p.drawString(350, 60, "Client Signature: __________________")
     p.showPage()
     p.save()
-    buffer.seek(0)
+    return client_name or project_name or f"project_{project_id}"
 
-    return send_file(buffer, as_attachment=True,
-                     download_name=f"{client_name}_duct_table.pdf",
+
+@app.route('/export_pdf/<int:project_id>')
+def export_pdf(project_id):
+    cur = get_db().cursor()
+    cur.execute("SELECT project_name, client_name FROM projects WHERE id = ?", (project_id,))
+    proj = cur.fetchone()
+    name = (proj and (proj["client_name"] or proj["project_name"])) or f"project_{project_id}"
+
+    path = cached_artifact("project_pdf", f"project:{project_id}", "pdf",
+                           lambda out: render_project_pdf(project_id, out))
+    return send_file(path, as_attachment=True,
+                     download_name=f"{name}_duct_table.pdf",
                      mimetype='application/pdf')
-    
- 
+
+
 # ---------- ✅ Export Excel ----------
 
 @app.route("/export_excel/<int:project_id>")
 def export_excel(project_id):
-    try:
-        conn = sqlite3.connect("database.db")
-        query = "SELECT * FROM duct_entries WHERE project_id = ?"
-        df = pd.read_sql_query(query, conn, params=(project_id,))
-        conn.close()
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM duct_entries WHERE project_id = ? LIMIT 1", (project_id,))
+    if not cur.fetchone():
+        return "No data available for this project.", 404
 
-        if df.empty:
-            return "No data available for this project.", 404
+    download_name = f"project_{project_id}_entries.xlsx"
+    path = artifact_path("project_excel", f"project:{project_id}", "xlsx")
+    if os.path.exists(path):
+        os.utime(path)
+        return send_file(path, as_attachment=True, download_name=download_name, mimetype=XLSX_MIMETYPE)
 
-        file_path = f"project_{project_id}_entries.xlsx"
-        df.to_excel(file_path, index=False)
+    # On a miss rows go from the cursor into the workbook as the client reads
+    # them, and the same bytes fill the cache for the next download
+    return Response(
+        stream_with_context(tee_artifact(path, iter_project_xlsx(project_id))),
+        mimetype=XLSX_MIMETYPE,
+        headers={"Content-Disposition": f"attachment; filename={download_name}"})
 
-        return send_file(file_path, as_attachment=True)
 
-    except Exception as e:
-        return f"Error exporting data: {e}", 500
+PROJECT_XLSX_ROWS_SQL = "SELECT * FROM duct_entries WHERE project_id = ? ORDER BY id"
+
+
+def iter_project_xlsx(project_id):
+    """Yield the project's duct workbook from a private connection.
 
+    The response keeps reading after the view returns and the request's
+    pooled connection has gone back to the pool, so the rows must not come
+    from get_db().
+    """
+    conn = open_db()
+    try:
+        cur = conn.execute(PROJECT_XLSX_ROWS_SQL, (project_id,))
+        header = [column[0] for column in cur.description]
+        yield from iter_xlsx(header, (tuple(row) for row in cur), sheet_title="Duct Entries")
     finally:
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        conn.close()
+
+
+def write_project_excel(project_id, out):
+    for chunk in iter_project_xlsx(project_id):
+        out.write(chunk)
+    return f"project_{project_id}_entries.xlsx"
 
 # ---------- ✅ Production View ----------
+PRODUCTION_PROGRESS_SQL = "SELECT * FROM production_progress WHERE project_id = ?"
+PRODUCTION_HISTORY_SQL = """
+    SELECT stage, delta, value, updated_by, created_at FROM production_events
+    WHERE project_id = ? ORDER BY id DESC LIMIT 20
+"""
+
+
 @app.route("/production/<int:project_id>")
 def production(project_id):
     conn = get_db()
@@ -1092,32 +2717,18 @@ def production(project_id):
         flash("Project not found", "danger")
         return redirect(url_for("projects"))
 
-    cur.execute("SELECT * FROM duct_entries WHERE project_id = ?", (project_id,))
-    ducts = cur.fetchall()
-
-    total_area = sum(float(d["area"] or 0) for d in ducts)
-    total_nuts = sum(float(d["nuts_bolts"] or 0) for d in ducts)
-    total_cleat = sum(float(d["cleat"] or 0) for d in ducts)
-    total_gasket = sum(float(d["gasket"] or 0) for d in ducts)
-    total_corner = sum(float(d["corner_pieces"] or 0) for d in ducts)
-    total_weight = sum(float(d["weight"] or 0) for d in ducts)
-
-    cur.execute("UPDATE projects SET total_sqm = ? WHERE id = ?", (total_area, project_id))
-    conn.commit()
+    # Duct rows are paged in by the page itself from /api/project/<id>/ducts
+    totals = get_project_totals(cur, project_id)
+    total_area = totals["total_area"]
 
-    cur.execute("SELECT * FROM production_progress WHERE project_id = ?", (project_id,))
+    cur.execute(PRODUCTION_PROGRESS_SQL, (project_id,))
     progress = cur.fetchone()
-
     if not progress:
-        cur.execute("""
-            INSERT INTO production_progress (
-              project_id, sheet_cutting_sqm, plasma_fabrication_sqm, 
-              boxing_assembly_sqm, quality_check_pct, dispatch_percent
-            ) VALUES (?, 0, 0, 0, 0, 0)
-        """, (project_id,))
-        conn.commit()
-        cur.execute("SELECT * FROM production_progress WHERE project_id = ?", (project_id,))
-        progress = cur.fetchone()
+        # Nothing recorded yet; the row is created by the first update
+        progress = {"project_id": project_id, **{column: 0 for column in PRODUCTION_STAGES.values()}}
+
+    cur.execute(PRODUCTION_HISTORY_SQL, (project_id,))
+    history = cur.fetchall()
 
     # Calculate stage-wise percentage (based on sqm)
     sheet_pct = ((progress["sheet_cutting_sqm"] or 0) / total_area * 100) if total_area else 0
@@ -1142,14 +2753,14 @@ def production(project_id):
     conn.close()
     return render_template("production.html",
                            project=project,
-                           ducts=ducts,
                            progress=progress_dict,
+                           history=history,
                            total_area=total_area,
-                           total_nuts=total_nuts,
-                           total_cleat=total_cleat,
-                           total_gasket=total_gasket,
-                           total_corner=total_corner,
-                           total_weight=total_weight)
+                           total_nuts=totals["total_nuts"],
+                           total_cleat=totals["total_cleat"],
+                           total_gasket=totals["total_gasket"],
+                           total_corner=totals["total_corner"],
+                           total_weight=totals["total_weight"])
 
 
 
@@ -1163,154 +2774,605 @@ def update_production(project_id):
 
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("""
-        UPDATE production_progress SET
-            sheet_cutting_sqm = ?,
-            plasma_fabrication_sqm = ?,
-            boxing_assembly_sqm = ?,
-            quality_check_pct = ?,
-            dispatch_percent = ?
-        WHERE project_id = ?
-    """, (sheet, plasma, boxing, qc, dispatch, project_id))
+    record_production(cur, project_id, {
+        "sheet_cutting": sheet,
+        "plasma_fabrication": plasma,
+        "boxing_assembly": boxing,
+        "quality_check": qc,
+        "dispatch": dispatch,
+    }, session.get('user'))
     conn.commit()
     conn.close()
     return redirect(url_for("production", project_id=project_id))
 
+# ---------- ✅ Production Progress Log ----------
+# Every stage update is appended to production_events as a delta (who, when,
+# which stage, how much). production_progress is the compact current state:
+# a trigger adds each event's delta to the project's single row, and
+# `flask rebuild-production` recomputes it from the log.
+
+PRODUCTION_STAGES = {
+    "sheet_cutting": "sheet_cutting_sqm",
+    "plasma_fabrication": "plasma_fabrication_sqm",
+    "boxing_assembly": "boxing_assembly_sqm",
+    "quality_check": "quality_check_pct",
+    "dispatch": "dispatch_percent",
+}
+THROUGHPUT_STAGES = ["sheet_cutting", "plasma_fabrication", "boxing_assembly"]
+THROUGHPUT_DAYS = 30
+
+
+def production_event_trigger_sql():
+    sets = ", ".join(
+        f"{column} = COALESCE({column}, 0) + CASE WHEN NEW.stage = '{stage}' THEN NEW.delta ELSE 0 END"
+        for stage, column in PRODUCTION_STAGES.items()
+    )
+    return f"""CREATE TRIGGER IF NOT EXISTS trg_production_events_apply
+        AFTER INSERT ON production_events BEGIN
+        INSERT OR IGNORE INTO production_progress (project_id) VALUES (NEW.project_id);
+        UPDATE production_progress SET {sets} WHERE project_id = NEW.project_id;
+        END"""
+
+
+def rebuild_production_progress(cur, project_id=None):
+    """Recompute production_progress from the event log, for all projects or one."""
+    only_one = project_id is not None
+    params = (project_id,) if only_one else ()
+    cur.execute("DELETE FROM production_progress" + (" WHERE project_id = ?" if only_one else ""), params)
+    columns = ", ".join(PRODUCTION_STAGES.values())
+    sums = ", ".join(f"SUM(CASE WHEN stage = '{stage}' THEN delta ELSE 0 END)" for stage in PRODUCTION_STAGES)
+    cur.execute(f"""
+        INSERT INTO production_progress (project_id, {columns})
+        SELECT project_id, {sums}
+        FROM production_events
+        {"WHERE project_id = ?" if only_one else ""}
+        GROUP BY project_id
+    """, params)
+
+
+def record_production(cur, project_id, values, user):
+    """Append one event per stage whose value changed. `values` maps stage
+    names to new absolute values; returns the number of events written.
+
+    Takes the write lock before reading the current state, so two updates
+    can never both compute their delta from the same starting value. The
+    caller commits.
+    """
+    if not cur.connection.in_transaction:
+        cur.execute("BEGIN IMMEDIATE")
+    cur.execute("SELECT * FROM production_progress WHERE project_id = ?", (project_id,))
+    current = cur.fetchone()
+    events = []
+    for stage, value in values.items():
+        delta = value - float((current[PRODUCTION_STAGES[stage]] if current else 0) or 0)
+        if abs(delta) > 1e-9:
+            events.append((project_id, stage, delta, value, user))
+    cur.executemany("""
+        INSERT INTO production_events (project_id, stage, delta, value, updated_by)
+        VALUES (?, ?, ?, ?, ?)
+    """, events)
+    return len(events)
+
+
+@app.cli.command("rebuild-production")
+@click.option("--project-id", type=int, default=None, help="Only rebuild this project.")
+def rebuild_production_command(project_id):
+    """Recompute current production progress from the event log."""
+    conn = get_db()
+    rebuild_production_progress(conn.cursor(), project_id)
+    conn.commit()
+    print("✅ Production progress rebuilt.")
+
+
+@app.route("/api/production/throughput")
+def api_production_throughput():
+    """sqm completed per day for the fabrication stages, optionally for one project."""
+    days = min(max(request.args.get('days', THROUGHPUT_DAYS, type=int), 1), 366)
+    # The opening events copied in by the migration carry the migration's
+    # timestamp, not the day the work was done; they only seed the rebuild
+    where = ["created_at >= date('now', ?)", f"stage IN ({', '.join('?' * len(THROUGHPUT_STAGES))})",
+             "updated_by IS NOT 'migration'"]
+    params = [f"-{days - 1} days"] + THROUGHPUT_STAGES
+    project_id = request.args.get('project_id', type=int)
+    if project_id:
+        where.append("project_id = ?")
+        params.append(project_id)
+
+    cur = get_db().cursor()
+    cur.execute(f"""
+        SELECT date(created_at) AS day, stage, ROUND(SUM(delta), 2) AS sqm
+        FROM production_events
+        WHERE {' AND '.join(where)}
+        GROUP BY day, stage
+    """, params)
+    done = {(row["day"], row["stage"]): row["sqm"] for row in cur.fetchall()}
+
+    today = datetime.utcnow().date()
+    labels = [(today - timedelta(days=n)).isoformat() for n in range(days - 1, -1, -1)]
+    series = {stage: [done.get((day, stage), 0) for day in labels] for stage in THROUGHPUT_STAGES}
+    return jsonify(status="success", days=labels, series=series)
+
+
 # ---------- ✅ Production Overview ----------
+# Every project's area, stage percentages and overall progress in one grouped
+# query (area comes from the materialized project_totals), sorted and paged.
+
+OVERVIEW_SORT_COLUMNS = {
+    "id": "id", "project": "project_name", "vendor": "vendor_name", "status": "status",
+    "start": "start_date", "end": "end_date", "area": "total_sqm", "overall": "overall_pct",
+}
+OVERVIEW_PAGE_SIZE = 25
+OVERVIEW_PAGE_SIZE_MAX = 100
+
+PRODUCTION_OVERVIEW_SQL = """
+    SELECT *, ROUND((sheet_cutting_pct + plasma_fabrication_pct + boxing_assembly_pct
+                     + quality_check_pct + dispatch_pct) / 5, 1) AS overall_pct
+    FROM (
+        SELECT p.id, p.project_name, p.vendor_id, v.name AS vendor_name, p.start_date, p.end_date,
+               p.location, p.status,
+               ROUND(COALESCE(t.total_area, 0), 2) AS total_sqm,
+               CASE WHEN t.total_area > 0
+                    THEN ROUND(COALESCE(MAX(pp.sheet_cutting_sqm), 0) / t.total_area * 100, 1) ELSE 0 END
+                   AS sheet_cutting_pct,
+               CASE WHEN t.total_area > 0
+                    THEN ROUND(COALESCE(MAX(pp.plasma_fabrication_sqm), 0) / t.total_area * 100, 1) ELSE 0 END
+                   AS plasma_fabrication_pct,
+               CASE WHEN t.total_area > 0
+                    THEN ROUND(COALESCE(MAX(pp.boxing_assembly_sqm), 0) / t.total_area * 100, 1) ELSE 0 END
+                   AS boxing_assembly_pct,
+               ROUND(COALESCE(MAX(pp.quality_check_pct), 0), 1) AS quality_check_pct,
+               ROUND(COALESCE(MAX(pp.dispatch_percent), 0), 1) AS dispatch_pct
+        FROM projects p
+        LEFT JOIN vendors v ON v.id = p.vendor_id
+        LEFT JOIN project_totals t ON t.project_id = p.id
+        LEFT JOIN production_progress pp ON pp.project_id = p.id
+        GROUP BY p.id
+    )
+"""
+
+
+def production_overview_sql(sort, order):
+    """One page of the overview, sorted by an OVERVIEW_SORT_COLUMNS key; params are (limit, offset)."""
+    return f"""
+        {PRODUCTION_OVERVIEW_SQL}
+        ORDER BY {OVERVIEW_SORT_COLUMNS[sort]} {order.upper()}, id {order.upper()}
+        LIMIT ? OFFSET ?
+    """
+
 
 @app.route("/production_overview")
 def production_overview():
+    sort = request.args.get('sort', 'id')
+    if sort not in OVERVIEW_SORT_COLUMNS:
+        sort = 'id'
+    order = 'asc' if request.args.get('order', 'desc').lower() == 'asc' else 'desc'
+    per_page = min(max(request.args.get('per_page', OVERVIEW_PAGE_SIZE, type=int), 1), OVERVIEW_PAGE_SIZE_MAX)
+
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM projects")
+    cur.execute("SELECT COUNT(*) FROM projects")
+    total = cur.fetchone()[0]
+    pages = max(math.ceil(total / per_page), 1)
+    page = min(max(request.args.get('page', 1, type=int), 1), pages)
+
+    cur.execute(production_overview_sql(sort, order), (per_page, (page - 1) * per_page))
     projects = cur.fetchall()
     conn.close()
-    return render_template("production_overview.html", projects=projects)
-
-def get_summary_data():
-    conn = get_db()  # ✅ FIXED
+    return render_template("production_overview.html", projects=projects, sort=sort, order=order,
+                           page=page, pages=pages, per_page=per_page, total=total)
+
+
+# ---------- ✅ Summary Data ----------
+# Cross-project figures for charts and the summary API. Once a day (and then
+# at most every SUMMARY_SNAPSHOT_TTL seconds) the per-project rollups from
+# project_totals and production_progress are copied into summary_snapshots;
+# only projects whose data version or production log moved since the last
+# refresh are rewritten. Grouping by month, vendor or status is a GROUP BY
+# over one day's snapshot, so no duct row is read to draw a chart.
+
+SUMMARY_SNAPSHOT_TTL = 60
+SUMMARY_SNAPSHOT_DAYS = 400
+SUMMARY_GROUPS = {
+    "month": "s.month",
+    "vendor": "COALESCE(v.name, 'No vendor')",
+    "status": "s.status",
+    "project": "s.project_id",
+}
+SUMMARY_SNAPSHOT_COLUMNS = {
+    "area_24g": "t.area_24g", "area_22g": "t.area_22g", "area_20g": "t.area_20g", "area_18g": "t.area_18g",
+    "total_area": "t.total_area", "total_weight": "t.total_weight",
+    "sheet_cutting_sqm": "pp.sheet_cutting_sqm", "plasma_fabrication_sqm": "pp.plasma_fabrication_sqm",
+    "boxing_assembly_sqm": "pp.boxing_assembly_sqm", "quality_check_pct": "pp.quality_check_pct",
+    "dispatch_percent": "pp.dispatch_percent",
+}
+# Stage progress of a group: fabricated sqm over total area; QC and dispatch
+# are already percentages, so they are weighted by each project's area
+SUMMARY_STAGE_SQL = {
+    "sheet_cutting": "SUM(s.sheet_cutting_sqm) * 100.0 / SUM(s.total_area)",
+    "plasma_fabrication": "SUM(s.plasma_fabrication_sqm) * 100.0 / SUM(s.total_area)",
+    "boxing_assembly": "SUM(s.boxing_assembly_sqm) * 100.0 / SUM(s.total_area)",
+    "quality_check": "SUM(s.quality_check_pct * s.total_area) / SUM(s.total_area)",
+    "dispatch": "SUM(s.dispatch_percent * s.total_area) / SUM(s.total_area)",
+}
+SUMMARY_STAGE_LABELS = {
+    "sheet_cutting": "Sheet Cutting", "plasma_fabrication": "Plasma Fabrication",
+    "boxing_assembly": "Boxing & Assembly", "quality_check": "Quality Checking", "dispatch": "Dispatch",
+}
+
+_summary_refreshed = TTLCache(SUMMARY_SNAPSHOT_TTL, maxsize=4)
+
+
+def refresh_summary_snapshot(conn, day):
+    """Bring `day`'s snapshot up to date; returns the number of project rows written."""
+    columns = ", ".join(SUMMARY_SNAPSHOT_COLUMNS)
+    values = ", ".join(f"COALESCE({expr}, 0)" for expr in SUMMARY_SNAPSHOT_COLUMNS.values())
+    updates = ", ".join(f"{column} = excluded.{column}"
+                        for column in ["month", "vendor_id", "status", *SUMMARY_SNAPSHOT_COLUMNS, "source_version"])
     cur = conn.cursor()
+    cur.execute(f"""
+        INSERT INTO summary_snapshots (day, project_id, month, vendor_id, status, {columns}, source_version)
+        SELECT ?, p.id, substr(COALESCE(NULLIF(p.start_date, ''), p.created_at), 1, 7), p.vendor_id,
+               COALESCE(NULLIF(p.status, ''), 'new'), {values},
+               COALESCE(dv.version, 0) || ':' || COALESCE(
+                   (SELECT MAX(e.id) FROM production_events e WHERE e.project_id = p.id), 0)
+        FROM projects p
+        LEFT JOIN project_totals t ON t.project_id = p.id
+        LEFT JOIN production_progress pp ON pp.project_id = p.id
+        LEFT JOIN data_versions dv ON dv.scope = 'project:' || p.id
+        WHERE true
+        ON CONFLICT(day, project_id) DO UPDATE SET {updates}
+        WHERE summary_snapshots.source_version != excluded.source_version
+    """, (day,))
+    written = cur.rowcount
+    cur.execute("DELETE FROM summary_snapshots WHERE day = ? AND project_id NOT IN (SELECT id FROM projects)",
+                (day,))
+    cur.execute("DELETE FROM summary_snapshots WHERE day < date(?, ?)", (day, f"-{SUMMARY_SNAPSHOT_DAYS} days"))
+    conn.commit()
+    return written
+
+
+def summary_rollup_sql(group_sql):
+    """One day's snapshot rows summed per `group_sql`; takes the day as its parameter."""
+    stages = ", ".join(f"CASE WHEN SUM(s.total_area) > 0 THEN ROUND(MIN({expr}, 100), 1) ELSE 0 END AS {stage}"
+                       for stage, expr in SUMMARY_STAGE_SQL.items())
+    return f"""
+        SELECT {group_sql} AS grp, COUNT(*) AS projects,
+               ROUND(SUM(s.area_24g), 2) AS area_24g, ROUND(SUM(s.area_22g), 2) AS area_22g,
+               ROUND(SUM(s.area_20g), 2) AS area_20g, ROUND(SUM(s.area_18g), 2) AS area_18g,
+               ROUND(SUM(s.total_area), 2) AS total_area, ROUND(SUM(s.total_weight), 2) AS total_weight,
+               {stages}
+        FROM summary_snapshots s
+        LEFT JOIN vendors v ON v.id = s.vendor_id
+        WHERE s.day = ?
+        GROUP BY grp
+        ORDER BY grp
+    """
+
+
+def summary_membership_sql(group_sql):
+    """Each project of one day's snapshot with its `group_sql` group."""
+    return f"""
+        SELECT s.project_id, p.project_name, {group_sql} AS grp
+        FROM summary_snapshots s
+        LEFT JOIN projects p ON p.id = s.project_id
+        LEFT JOIN vendors v ON v.id = s.vendor_id
+        WHERE s.day = ?
+    """
+
+
+def get_summary_data(group_by="status", day=None, with_projects=False):
+    """Gauge-wise area, weight and stage progress grouped by month, vendor,
+    status or project. Today's snapshot is refreshed first; earlier days are
+    read as they were recorded."""
+    conn = get_db()
+    today = datetime.today().strftime('%Y-%m-%d')
+    day = day or today
+    if day == today and _summary_refreshed.get(day) is None:
+        refresh_summary_snapshot(conn, day)
+        _summary_refreshed.set(day, True)
+
+    def rollup(group_sql):
+        cur = conn.execute(summary_rollup_sql(group_sql), (day,))
+        return [dict(row) for row in cur.fetchall()]
+
+    groups = rollup(SUMMARY_GROUPS[group_by])
+    if with_projects and group_by != "project":
+        # Per-project rows under their group, one more pass over the same snapshot
+        by_group = {group["grp"]: group for group in groups}
+        cur = conn.execute(summary_membership_sql(SUMMARY_GROUPS[group_by]), (day,))
+        membership = {row["project_id"]: (row["grp"], row["project_name"]) for row in cur.fetchall()}
+        for project in rollup("s.project_id"):
+            grp, name = membership[project["grp"]]
+            project["project_id"], project["project_name"] = project.pop("grp"), name
+            by_group[grp].setdefault("project_list", []).append(project)
+    return {"day": day, "group_by": group_by, "groups": groups}
+
+
+def summary_graph_data(data):
+    """Chart.js bar data: one dataset per stage, one bar group per summary group."""
+    return {
+        "labels": [str(group["grp"]) for group in data["groups"]],
+        "datasets": [{"label": label, "data": [group[stage] for group in data["groups"]]}
+                     for stage, label in SUMMARY_STAGE_LABELS.items()],
+    }
 
-    cur.execute('SELECT * FROM projects')
-    projects = cur.fetchall()
 
-    cur.execute('SELECT * FROM production_progress')
-    production = cur.fetchall()
+@app.route("/api/summary")
+def api_summary():
+    group_by = request.args.get('group_by', 'status')
+    if group_by not in SUMMARY_GROUPS:
+        return jsonify(status="error", message=f"group_by must be one of {', '.join(SUMMARY_GROUPS)}"), 400
+    day = request.args.get('day')
+    if day:
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            return jsonify(status="error", message="day must be YYYY-MM-DD"), 400
+    data = get_summary_data(group_by, day, with_projects=request.args.get('projects') == '1')
+    return jsonify(status="success", **data)
+
+# ---------- ✅ Summary Report ----------
+# The summary is assembled from stored data: gauge areas from project_totals,
+# stage percentages from production_progress (the overview query). Signatures
+# and source diagrams are decoded and resized once on upload and kept as PNGs
+# named by their content hash; summary_assets maps each slot ("md_signature",
+# "pm_signature", "diagram:<project_id>") to the current file. Each rendered
+# report is stored in summary_reports under a data version built from
+# everything it was drawn from, so regenerating an unchanged project is a
+# lookup.
+
+SUMMARY_ASSET_DIR = os.path.join(app.instance_path, "summary_assets")
+# Stored at 3x the size they are drawn at in the PDF
+SUMMARY_ASSET_SIZES = {"signature": (360, 120), "diagram": (720, 480)}
+SUMMARY_SIGNATURES = {"md_signature": "Managing Director", "pm_signature": "Project Manager"}
+SUMMARY_STAGES = [
+    ("Sheet Cutting", "sheet_cutting_pct", "sheet_cutting"),
+    ("Plasma Fabrication", "plasma_fabrication_pct", "plasma_fabrication"),
+    ("Boxing & Assembly", "boxing_assembly_pct", "boxing_assembly"),
+    ("Quality Checking", "quality_check_pct", "quality_checking"),
+    ("Dispatch", "dispatch_pct", "dispatch"),
+]
+SUMMARY_GAUGES = ["24g", "22g", "20g", "18g"]
+
+
+def save_summary_asset(cur, slot, upload, size):
+    """Store an uploaded image for `slot` as a resized PNG; returns its digest.
+
+    The same image uploaded again is recognised by its hash and not decoded.
+    """
+    from PIL import Image
+
+    raw = upload.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    path = os.path.join(SUMMARY_ASSET_DIR, f"{digest}.png")
+    if not os.path.exists(path):
+        os.makedirs(SUMMARY_ASSET_DIR, exist_ok=True)
+        image = Image.open(io.BytesIO(raw))
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        image.thumbnail(size)
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        image.save(partial, format="PNG", optimize=True)
+        os.replace(partial, path)
+    cur.execute("""
+        INSERT INTO summary_assets (slot, digest, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(slot) DO UPDATE SET digest = excluded.digest, updated_at = excluded.updated_at
+    """, (slot, digest))
+    return digest
+
 
-    cur.execute('SELECT * FROM duct_entries')
-    ducts = cur.fetchall()
+def summary_asset_digests(cur, project_id):
+    slots = list(SUMMARY_SIGNATURES) + [f"diagram:{project_id}"]
+    cur.execute(f"SELECT slot, digest FROM summary_assets WHERE slot IN ({', '.join('?' * len(slots))})", slots)
+    found = {row["slot"]: row["digest"] for row in cur.fetchall()}
+    return {"diagram" if slot.startswith("diagram:") else slot: found.get(slot) for slot in slots}
 
-    conn.close()
 
-    return {
-        'projects': [dict(row) for row in projects],
-        'production': [dict(row) for row in production],
-        'ducts': [dict(row) for row in ducts]
-    }
+def summary_asset_path(digest):
+    path = os.path.join(SUMMARY_ASSET_DIR, f"{digest}.png") if digest else None
+    return path if path and os.path.exists(path) else None
+
+
+def summary_report_version(cur, project_id, assets):
+    """Identifies the inputs of a project's summary: its ducts and details,
+    its production log and the images it shows."""
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM production_events WHERE project_id = ?", (project_id,))
+    last_event = cur.fetchone()[0]
+    parts = [ARTIFACT_FORMAT_VERSION, data_version(cur, f"project:{project_id}"), last_event,
+             assets["diagram"], assets["md_signature"], assets["pm_signature"]]
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+
+def summary_as_of(cur, project_id):
+    """Date the summary's progress figures are as of: the project's last
+    production update, or its creation for a project with none. It depends only
+    on inputs of summary_report_version, so cached reports never show a stale
+    date."""
+    cur.execute("""
+        SELECT COALESCE(
+            (SELECT created_at FROM production_events WHERE project_id = ? ORDER BY id DESC LIMIT 1),
+            (SELECT created_at FROM projects WHERE id = ?))
+    """, (project_id, project_id))
+    as_of = cur.fetchone()[0]
+    return datetime.strptime(as_of[:10], "%Y-%m-%d").strftime("%d-%m-%Y") if as_of else None
+
+
+def render_summary_pdf(out, project, totals, assets, as_of=None):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import Table, TableStyle
+    from reportlab.lib import colors
+
+    pdf = canvas.Canvas(out, pagesize=landscape(A4), pageCompression=1)
+    width, height = landscape(A4)
+
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(30, height - 40, "Project Summary Report")
+
+    y = height - 80
+    pdf.setFont("Helvetica", 12)
+    pdf.drawString(30, y, f"Project: {project['project_name'] or project['id']}")
+    pdf.drawString(300, y, f"Vendor: {project['vendor_name'] or ''}")
+    if as_of:
+        pdf.drawString(600, y, f"Progress as of: {as_of}")
+    y -= 20
+
+    # Gauge table
+    data = [["Gauge", "Area (sq.m)"]] + [[g.upper(), f"{totals[f'area_{g}']:.2f}"] for g in SUMMARY_GAUGES]
+    data.append(["Total", f"{totals['total_area']:.2f}"])
+    table = Table(data, colWidths=[100, 150])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    table.wrapOn(pdf, width, height)
+    table.drawOn(pdf, 30, y - 120)
+
+    # Stage progress table
+    data2 = [["Stage", "Progress (%)"]] + [[label, f"{project[column]}"] for label, column, _ in SUMMARY_STAGES]
+    data2.append(["Overall", f"{project['overall_pct']} %"])
+    table2 = Table(data2, colWidths=[200, 150])
+    table2.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.green),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    table2.wrapOn(pdf, width, height)
+    table2.drawOn(pdf, 300, y - 140)
+
+    # Pre-resized PNGs; reportlab only reads the file
+    diagram = summary_asset_path(assets["diagram"])
+    if diagram:
+        pdf.drawString(600, height - 140, "Source Diagram")
+        pdf.drawImage(diagram, 600, height - 310, width=210, height=140, preserveAspectRatio=True, mask='auto')
+
+    x = 50
+    for slot, label in SUMMARY_SIGNATURES.items():
+        pdf.setFont("Helvetica", 10)
+        pdf.drawString(x, 85, label)
+        signature = summary_asset_path(assets[slot])
+        if signature:
+            pdf.drawImage(signature, x, 40, width=120, height=40, preserveAspectRatio=True, mask='auto')
+        x += 200
+
+    pdf.save()
+
+
+def get_summary_report(project_id):
+    """Rendered summary PDF for a project, from summary_reports when nothing it
+    shows has changed since it was last built. Returns (bytes, download name),
+    or None for an unknown project."""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(f"{PRODUCTION_OVERVIEW_SQL} WHERE id = ?", (project_id,))
+    project = cur.fetchone()
+    if not project:
+        return None
+    download_name = f"{project['project_name'] or project_id}_summary.pdf"
+
+    assets = summary_asset_digests(cur, project_id)
+    version = summary_report_version(cur, project_id, assets)
+    cur.execute("""
+        SELECT report_pdf FROM summary_reports
+        WHERE project_id = ? AND data_version = ? AND report_pdf IS NOT NULL
+        ORDER BY id DESC LIMIT 1
+    """, (str(project_id), version))
+    stored = cur.fetchone()
+    if stored:
+        return stored["report_pdf"], download_name
+
+    totals = get_project_totals(cur, project_id)
+    out = io.BytesIO()
+    render_summary_pdf(out, project, totals, assets, summary_as_of(cur, project_id))
+    report = out.getvalue()
+
+    stages = [project[column] for _, column, _ in SUMMARY_STAGES]
+    cur.execute(f"""
+        INSERT INTO summary_reports (
+            project_id, diagram, area_24g, area_22g, area_20g, area_18g,
+            {', '.join(name for _, _, name in SUMMARY_STAGES)},
+            overall_progress, md_signature, pm_signature, data_version, report_pdf
+        ) VALUES ({', '.join('?' * 16)})
+    """, (str(project_id), assets["diagram"], *(totals[f"area_{g}"] for g in SUMMARY_GAUGES),
+          *stages, project["overall_pct"], assets["md_signature"], assets["pm_signature"],
+          version, report))
+    # Older renders are superseded; their figures stay as history
+    cur.execute("UPDATE summary_reports SET report_pdf = NULL WHERE project_id = ? AND id != ?",
+                (str(project_id), cur.lastrowid))
+    conn.commit()
+    return report, download_name
+
 
-# ---------- ✅ Summary Placeholder ----------
 @app.route("/summary", methods=["GET", "POST"])
 def summary():
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT id, project_name FROM projects")
+    if request.method == "POST":
+        project_id = request.form.get("project_id", type=int)
+        if not project_id:
+            flash("❌ Select a project.", "danger")
+            return redirect(url_for("summary"))
+        uploads = [(f"diagram:{project_id}", request.files.get("diagram"), SUMMARY_ASSET_SIZES["diagram"])]
+        uploads += [(slot, request.files.get(slot), SUMMARY_ASSET_SIZES["signature"]) for slot in SUMMARY_SIGNATURES]
+        try:
+            for slot, upload, size in uploads:
+                if upload and upload.filename:
+                    save_summary_asset(cur, slot, upload, size)
+        except Exception as e:
+            conn.rollback()
+            flash(f"❌ Could not read uploaded image: {e}", "danger")
+            return redirect(url_for("summary"))
+        conn.commit()
+        return redirect(url_for("summary_report", project_id=project_id))
+
+    cur.execute("SELECT id, project_name FROM projects ORDER BY project_name")
     projects = cur.fetchall()
+    cur.execute("SELECT slot FROM summary_assets WHERE slot IN ('md_signature', 'pm_signature')")
+    stored_signatures = {row["slot"] for row in cur.fetchall()}
+    group_by = request.args.get('group_by', 'status')
+    if group_by not in SUMMARY_GROUPS:
+        group_by = 'status'
+    graph_data = summary_graph_data(get_summary_data(group_by))
+    return render_template("summary.html", projects=projects, stored_signatures=stored_signatures,
+                           graph_data=graph_data)
+
+
+@app.route("/summary/<int:project_id>.pdf")
+def summary_report(project_id):
+    report = get_summary_report(project_id)
+    if report is None:
+        flash("❌ Project not found.", "danger")
+        return redirect(url_for("summary"))
+    data, download_name = report
+    return send_file(io.BytesIO(data), as_attachment=True, download_name=download_name,
+                     mimetype="application/pdf")
+
+
+def write_summary_report(out, project_id):
+    report = get_summary_report(project_id)
+    if report is None:
+        raise ValueError(f"Project {project_id} not found")
+    data, download_name = report
+    out.write(data)
+    return download_name
+
+
+def write_summary_pack(out):
+    """ZIP of every project's summary; unchanged projects come from summary_reports."""
+    cur = get_db().cursor()
+    cur.execute("SELECT id FROM projects ORDER BY id")
+    project_ids = [row["id"] for row in cur.fetchall()]
+    reports = (get_summary_report(project_id) for project_id in project_ids)
+    for chunk in iter_zip((f"{project_id}_{name}", data)
+                          for project_id, (data, name) in zip(project_ids, reports)):
+        out.write(chunk)
+    return f"Summary_Pack_{datetime.now().strftime('%Y-%m')}.zip"
 
-    if request.method == "POST":
-        project_id = request.form.get("project_id")
-        source_diagram = request.files.get("source_diagram")
-        md_sig = request.files.get("md_signature")
-        pm_sig = request.files.get("pm_signature")
-
-        # Area per gauge
-        gauges = ['24g', '22g', '20g', '18g']
-        areas = {g: float(request.form.get(g, 0)) for g in gauges}
-
-        # Stages progress
-        stages = {
-            'Sheet Cutting': float(request.form.get('sheet_cutting', 0)),
-            'Plasma Fabrication': float(request.form.get('plasma_fabrication', 0)),
-            'Boxing & Assembly': float(request.form.get('boxing_assembly', 0)),
-            'Quality Checking': float(request.form.get('quality_checking', 0)),
-            'Dispatch': float(request.form.get('dispatch', 0)),
-        }
-        overall = round(sum(stages.values()) / len(stages), 2)
-
-        # Load images
-        from io import BytesIO
-        from PIL import Image
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4, landscape
-        from reportlab.platypus import Table, TableStyle
-        from reportlab.lib import colors
-
-        buffer = BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=landscape(A4))
-        width, height = landscape(A4)
-
-        pdf.setFont("Helvetica-Bold", 16)
-        pdf.drawString(30, height - 40, "Project Summary Report")
-
-        y = height - 80
-        pdf.setFont("Helvetica", 12)
-        pdf.drawString(30, y, f"Project ID: {project_id}")
-        y -= 20
-
-        # Gauge table
-        data = [["Gauge", "Area (sq.m)"]] + [[k.upper(), str(v)] for k, v in areas.items()]
-        table = Table(data, colWidths=[100, 150])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
-        table.wrapOn(pdf, width, height)
-        table.drawOn(pdf, 30, y - 100)
-        y -= 120
-
-        # Stage progress table
-        data2 = [["Stage", "Progress (%)"]] + [[k, str(v)] for k, v in stages.items()] + [["Overall", f"{overall} %"]]
-        table2 = Table(data2, colWidths=[200, 150])
-        table2.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.green),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
-        table2.wrapOn(pdf, width, height)
-        table2.drawOn(pdf, 300, y - 100)
-
-        # Draw signatures
-        def draw_signature(img, x, y, label):
-            img = Image.open(BytesIO(img.read())).resize((120, 40))
-            img_io = BytesIO()
-            img.save(img_io, format="PNG")
-            img_io.seek(0)
-            pdf.setFont("Helvetica", 10)
-            pdf.drawString(x, y + 45, label)
-            pdf.drawInlineImage(img_io, x, y, width=120, height=40)
-
-        draw_signature(md_sig, 50, 40, "Managing Director")
-        draw_signature(pm_sig, 250, 40, "Project Manager")
-
-        # Optional: embed source diagram if needed
-        if source_diagram:
-            img = Image.open(BytesIO(source_diagram.read())).resize((150, 100))
-            img_io = BytesIO()
-            img.save(img_io, format="PNG")
-            img_io.seek(0)
-            pdf.drawString(600, height - 300, "Source Diagram")
-            pdf.drawInlineImage(img_io, 600, height - 420, width=150, height=100)
-
-        pdf.save()
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name="summary_report.pdf", mimetype="application/pdf")
-
-    return render_template("summary.html", projects=projects)
 # ---------- ✅ Submit Full Project and Move to Production ----------
 
 @app.route('/submit_all/<project_id>', methods=['POST'])
@@ -1365,7 +3427,10 @@ def register_employee():
             # Generate employee ID (format: VE/EMP/0001)
             conn = get_db()
             cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM employees")
+            cur.execute("""
+                SELECT COALESCE(MAX(CAST(substr(emp_id, 8) AS INTEGER)), 0) FROM employees
+                WHERE emp_id LIKE 'VE/EMP/%'
+            """)
             emp_count = cur.fetchone()[0] + 1
             emp_id = f"VE/EMP/{str(emp_count).zfill(4)}"
 
@@ -1384,6 +3449,11 @@ def register_employee():
                 department, designation, email, phone, join_date,
                 address, role, photo_filename, default_password
             ))
+            if email:
+                cur.execute('''
+                    INSERT OR IGNORE INTO employee_logins (employee_id, username, password_hash, role)
+                    VALUES (?, ?, ?, ?)
+                ''', (emp_id, email, default_password, role))
             conn.commit()
             conn.close()
 
@@ -1399,18 +3469,13 @@ def register_employee():
     return render_template('register_employee.html')
     # --- GET method: show the form ---
     
-@app.route('/employee_list')
-def employee_list():
-    if 'user' not in session:
-        return redirect(url_for('login'))
+EMPLOYEE_DEPARTMENTS_SQL = "SELECT DISTINCT department FROM employees"
+EMPLOYEE_ROLES_SQL = "SELECT DISTINCT role FROM employees"
+EMPLOYEE_BY_ID_SQL = "SELECT * FROM employees WHERE emp_id=?"
 
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Get filters from query params
-    department = request.args.get('department', '')
-    role = request.args.get('role', '')
 
+def employee_filter_sql(department, role):
+    """SQL + params for the employee list filtered by department and role."""
     query = "SELECT * FROM employees WHERE 1=1"
     params = []
 
@@ -1420,14 +3485,28 @@ def employee_list():
     if role:
         query += " AND role = ?"
         params.append(role)
+    return query, params
 
-    cur.execute(query, params)
+
+@app.route('/employee_list')
+def employee_list():
+    if 'user' not in session:
+        return redirect(url_for('login'))
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    # Get filters from query params
+    department = request.args.get('department', '')
+    role = request.args.get('role', '')
+
+    cur.execute(*employee_filter_sql(department, role))
     employees = cur.fetchall()
 
     # Get unique department and role values for filters
-    cur.execute("SELECT DISTINCT department FROM employees")
+    cur.execute(EMPLOYEE_DEPARTMENTS_SQL)
     departments = [row['department'] for row in cur.fetchall()]
-    cur.execute("SELECT DISTINCT role FROM employees")
+    cur.execute(EMPLOYEE_ROLES_SQL)
     roles = [row['role'] for row in cur.fetchall()]
 
     conn.close()
@@ -1440,8 +3519,9 @@ def delete_employee(emp_id):
     conn = get_db()
     cur = conn.cursor()
     cur.execute("DELETE FROM employees WHERE emp_id = ?", (emp_id,))
-    cur.execute("DELETE FROM users WHERE email = ?", (emp_id,))
+    cur.execute("DELETE FROM employee_logins WHERE employee_id = ?", (emp_id,))
     conn.commit()
+    _role_cache.pop(f"employee:{emp_id}")
     conn.close()
 
     flash("🗑️ Employee deleted successfully.", "success")
@@ -1468,14 +3548,25 @@ def edit_employee(emp_id):
             UPDATE employees SET name=?, department=?, designation=?, phone=?, email=?, role=?, address=?
             WHERE emp_id=?
         ''', (name, department, designation, phone, email, role, address, emp_id))
+        # The login username is the employee's email; a blank email keeps the old one
+        try:
+            cur.execute('''
+                UPDATE employee_logins SET role = ?, username = COALESCE(NULLIF(TRIM(?), ''), username)
+                WHERE employee_id = ?
+            ''', (role, email, emp_id))
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            flash(f"⚠️ Another employee already logs in as {email.strip()}.", "warning")
+            return redirect(url_for('employee_list'))
         conn.commit()
+        _role_cache.pop(f"employee:{emp_id}")
         conn.close()
 
         flash("✅ Employee details updated.", "success")
         return redirect(url_for('employee_list'))
 
     else:
-        cur.execute("SELECT * FROM employees WHERE emp_id=?", (emp_id,))
+        cur.execute(EMPLOYEE_BY_ID_SQL, (emp_id,))
         employee = cur.fetchone()
         conn.close()
         if employee:
@@ -1485,17 +3576,65 @@ def edit_employee(emp_id):
             return redirect(url_for('employee_list'))
 @app.route('/export_employees')
 def export_employees():
-    import pandas as pd
     if 'user' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db()
-    df = pd.read_sql_query("SELECT * FROM employees", conn)
-    conn.close()
+    return send_generated(write_employees_excel, "employee_list.xlsx", XLSX_MIMETYPE)
+
+
+def write_employees_excel(out):
+    df = pd.read_sql_query("SELECT * FROM employees", get_db())
+    df.to_excel(out, index=False)
+    return "employee_list.xlsx"
+
+def draw_id_card(c, emp):
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(100, 180, "VANES ENGINEERING")
+    c.setFont("Helvetica", 10)
+    c.drawString(20, 150, f"Emp ID: {emp['emp_id']}")
+    c.drawString(20, 135, f"Name: {emp['name']}")
+    c.drawString(20, 120, f"Dept: {emp['department']}")
+    c.drawString(20, 105, f"Role: {emp['role']}")
+    c.drawString(20, 90, f"Join Date: {emp['join_date']}")
+    c.drawString(20, 60, "Signature: _______________")
+    c.showPage()
+
+
+def draw_joining_letter(c, emp):
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(100, 800, "Joining Letter")
+    c.setFont("Helvetica", 11)
+    c.drawString(40, 770, f"Date: {emp['join_date']}")
+    c.drawString(40, 740, f"To: {emp['name']},")
+    c.drawString(40, 720, f"Department: {emp['department']}")
+    c.drawString(40, 700, f"Designation: {emp['designation']}")
+    c.drawString(40, 660, f"Dear {emp['name']},")
+    c.drawString(40, 640, "We are pleased to confirm your joining as a valued team member.")
+    c.drawString(40, 620, "You are appointed as:")
+    c.drawString(60, 600, f"Role: {emp['role']}")
+    c.drawString(40, 560, "Please contact HR for further onboarding.")
+    c.drawString(40, 520, "Regards,")
+    c.drawString(40, 500, "Vanes Engineering")
+    c.showPage()
+
+
+ID_CARD_PAGESIZE = (300, 200)
+
+
+def write_id_card(emp, out):
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(out, pagesize=ID_CARD_PAGESIZE)
+    draw_id_card(c, emp)
+    c.save()
+
+
+def write_joining_letter(emp, out):
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(out)
+    draw_joining_letter(c, emp)
+    c.save()
+
 
-    output_file = f"/tmp/employee_list.xlsx"
-    df.to_excel(output_file, index=False)
-    return send_file(output_file, as_attachment=True)
 @app.route('/download_id_card/<path:emp_id>')
 def download_id_card(emp_id):
     if 'user' not in session:
@@ -1510,23 +3649,10 @@ def download_id_card(emp_id):
         if not emp:
             return "Employee not found", 404
 
-        from reportlab.pdfgen import canvas
-        safe_emp_id = emp_id.replace("/", "_")  # <-- important fix
-        pdf_path = f"/tmp/{safe_emp_id}_id_card.pdf"
-        c = canvas.Canvas(pdf_path, pagesize=(300, 200))
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(100, 180, "VANES ENGINEERING")
-        c.setFont("Helvetica", 10)
-        c.drawString(20, 150, f"Emp ID: {emp['emp_id']}")
-        c.drawString(20, 135, f"Name: {emp['name']}")
-        c.drawString(20, 120, f"Dept: {emp['department']}")
-        c.drawString(20, 105, f"Role: {emp['role']}")
-        c.drawString(20, 90, f"Join Date: {emp['join_date']}")
-        c.drawString(20, 60, "Signature: _______________")
-        c.showPage()
-        c.save()
-
-        return send_file(pdf_path, as_attachment=True, download_name=f"{emp_id}_ID_Card.pdf")
+        path = cached_artifact("id_card", f"employee:{emp_id}", "pdf",
+                               lambda out: write_id_card(emp, out))
+        return send_file(path, as_attachment=True, download_name=f"{emp_id.replace('/', '_')}_ID_Card.pdf",
+                         mimetype='application/pdf')
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -1546,45 +3672,121 @@ def download_joining_letter(emp_id):
         if not emp:
             return "Employee not found", 404
 
-        from reportlab.pdfgen import canvas
-        safe_emp_id = emp_id.replace("/", "_")  # <-- important fix
-        pdf_path = f"/tmp/{safe_emp_id}_joining_letter.pdf"
-        c = canvas.Canvas(pdf_path)
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(100, 800, "Joining Letter")
-        c.setFont("Helvetica", 11)
-        c.drawString(40, 770, f"Date: {emp['join_date']}")
-        c.drawString(40, 740, f"To: {emp['name']},")
-        c.drawString(40, 720, f"Department: {emp['department']}")
-        c.drawString(40, 700, f"Designation: {emp['designation']}")
-        c.drawString(40, 660, f"Dear {emp['name']},")
-        c.drawString(40, 640, "We are pleased to confirm your joining as a valued team member.")
-        c.drawString(40, 620, "You are appointed as:")
-        c.drawString(60, 600, f"Role: {emp['role']}")
-        c.drawString(40, 560, "Please contact HR for further onboarding.")
-        c.drawString(40, 520, "Regards,")
-        c.drawString(40, 500, "Vanes Engineering")
-        c.showPage()
-        c.save()
-
-        return send_file(pdf_path, as_attachment=True, download_name=f"{emp_id}_Joining_Letter.pdf")
+        path = cached_artifact("joining_letter", f"employee:{emp_id}", "pdf",
+                               lambda out: write_joining_letter(emp, out))
+        return send_file(path, as_attachment=True, download_name=f"{emp_id.replace('/', '_')}_Joining_Letter.pdf",
+                         mimetype='application/pdf')
     except Exception as e:
         import traceback
         traceback.print_exc()
         return "Internal Error in joining letter route", 500
 
-@app.route('/reset_password/<string:username>', methods=['POST'])
+# ---------- ✅ Bulk ID Cards / Joining Letters ----------
+# One request renders the documents for every employee matching the filter,
+# either as a single multi-page PDF or as a ZIP of per-employee PDFs. The ZIP
+# members are rendered in a process pool and streamed out in order as each
+# one finishes.
+
+BULK_DOCUMENTS = {
+    "id_cards": {"draw": draw_id_card, "pagesize": ID_CARD_PAGESIZE, "suffix": "ID_Card"},
+    "joining_letters": {"draw": draw_joining_letter, "pagesize": None, "suffix": "Joining_Letter"},
+}
+BULK_RENDER_WORKERS = int(os.environ.get("BULK_RENDER_WORKERS", os.cpu_count() or 2))
+
+_render_pool = None
+
+
+def get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=BULK_RENDER_WORKERS)
+    return _render_pool
+
+
+def render_employee_document(kind, emp):
+    """Render one employee's document to PDF bytes (runs in a pool process)."""
+    from reportlab.pdfgen import canvas
+    spec = BULK_DOCUMENTS[kind]
+    out = io.BytesIO()
+    c = canvas.Canvas(out, pagesize=spec["pagesize"]) if spec["pagesize"] else canvas.Canvas(out)
+    spec["draw"](c, emp)
+    c.save()
+    return out.getvalue()
+
+
+def write_bulk_pdf(kind, employees, out):
+    from reportlab.pdfgen import canvas
+    spec = BULK_DOCUMENTS[kind]
+    c = canvas.Canvas(out, pagesize=spec["pagesize"]) if spec["pagesize"] else canvas.Canvas(out)
+    for emp in employees:
+        spec["draw"](c, emp)
+    c.save()
+
+
+@app.route('/bulk_documents/<kind>')
+def bulk_employee_documents(kind):
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    if kind not in BULK_DOCUMENTS:
+        return "Unknown document type", 404
+
+    query = "SELECT * FROM employees WHERE 1=1"
+    params = []
+    if request.args.get('department'):
+        query += " AND department = ?"
+        params.append(request.args['department'])
+    if request.args.get('role'):
+        query += " AND role = ?"
+        params.append(request.args['role'])
+    if request.args.get('join_from'):
+        query += " AND join_date >= ?"
+        params.append(request.args['join_from'])
+    if request.args.get('join_to'):
+        query += " AND join_date <= ?"
+        params.append(request.args['join_to'])
+    query += " ORDER BY emp_id"
+
+    cur = get_db().cursor()
+    cur.execute(query, params)
+    employees = [dict(row) for row in cur.fetchall()]
+    if not employees:
+        return "No employees match this filter", 404
+
+    suffix = BULK_DOCUMENTS[kind]["suffix"]
+    if request.args.get('format', 'pdf') != 'zip':
+        return send_generated(lambda out: write_bulk_pdf(kind, employees, out),
+                              f"{suffix}s.pdf", 'application/pdf')
+
+    rendered = get_render_pool().map(render_employee_document, [kind] * len(employees), employees,
+                                     chunksize=8)
+    names = (f"{emp['emp_id'].replace('/', '_')}_{suffix}.pdf" for emp in employees)
+    return Response(iter_zip(zip(names, rendered)), mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={suffix}s.zip"})
+
+
+@app.route('/reset_password/<path:username>', methods=['POST'])
 def reset_password(username):
     if 'user' not in session:
         return redirect(url_for('login'))
 
-    import hashlib
     new_password = "emp@123"
-    hashed = hashlib.sha256(new_password.encode()).hexdigest()
+    hashed = generate_password_hash(new_password)
 
+    # `username` is the employee's login name or their emp_id
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("UPDATE users SET password = ? WHERE username = ?", (hashed, username))
+    cur.execute("UPDATE employee_logins SET password_hash = ? WHERE username = ? OR employee_id = ?",
+                (hashed, username, username))
+    if cur.rowcount == 0:
+        cur.execute("SELECT emp_id, email, role FROM employees WHERE emp_id = ? OR email = ?", (username, username))
+        emp = cur.fetchone()
+        if not emp or not emp['email']:
+            conn.close()
+            flash("⚠️ No login found for this employee.", "danger")
+            return redirect(url_for('employee_list'))
+        cur.execute("INSERT INTO employee_logins (employee_id, username, password_hash, role) VALUES (?, ?, ?, ?)",
+                    (emp['emp_id'], emp['email'], hashed, emp['role']))
+    cur.execute("UPDATE employees SET password = ? WHERE emp_id = ? OR email = ?", (hashed, username, username))
     conn.commit()
     conn.close()
 
@@ -1617,28 +3819,60 @@ def mark_attendance():
     cur = conn.cursor()
 
     if request.method == 'POST':
-        for emp_id in request.form.getlist('emp_id'):
-            status = request.form.get(f'status_{emp_id}', 'Absent')
-            check_in = request.form.get(f'check_in_{emp_id}', '')
-            check_out = request.form.get(f'check_out_{emp_id}', '')
-            date_today = datetime.today().strftime('%Y-%m-%d')
-
-            cur.execute('''
-                INSERT INTO attendance (emp_id, date, status, check_in, check_out)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (emp_id, date_today, status, check_in, check_out))
-        
+        date_marked = request.form.get('date') or datetime.today().strftime('%Y-%m-%d')
+        try:
+            datetime.strptime(date_marked, '%Y-%m-%d')
+        except ValueError:
+            flash("❌ Invalid attendance date.", "danger")
+            return redirect(url_for('mark_attendance'))
+
+        # The form posts one status_<emp_id> select per employee; an explicit
+        # emp_id list is still honoured for older clients.
+        emp_ids = request.form.getlist('emp_id') or [
+            key[len('status_'):] for key in request.form if key.startswith('status_')
+        ]
+        cur.execute("SELECT emp_id FROM employees")
+        known = {row['emp_id'] for row in cur.fetchall()}
+
+        rows = [
+            (emp_id, date_marked,
+             request.form.get(f'status_{emp_id}', 'Absent'),
+             request.form.get(f'check_in_{emp_id}') or None,
+             request.form.get(f'check_out_{emp_id}') or None)
+            for emp_id in dict.fromkeys(emp_ids) if emp_id in known
+        ]
+        cur.executemany('''
+            INSERT INTO attendance (emp_id, date, status, check_in, check_out)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(emp_id, date) DO UPDATE SET
+                status = excluded.status,
+                check_in = COALESCE(excluded.check_in, attendance.check_in),
+                check_out = COALESCE(excluded.check_out, attendance.check_out)
+        ''', rows)
         conn.commit()
         conn.close()
-        flash("✅ Attendance marked successfully!", "success")
+        flash(f"✅ Attendance marked for {len(rows)} employee(s) on {date_marked}!", "success")
         return redirect(url_for('attendance_dashboard'))  # redirect to main dashboard
 
     # GET method
-    cur.execute("SELECT emp_id, name FROM employees ORDER BY emp_id")
+    cur.execute("SELECT emp_id, name, department, role FROM employees ORDER BY emp_id")
     employees = cur.fetchall()
     conn.close()
     return render_template("attendance.html", employees=employees)
 
+ATTENDANCE_DAY_SQL = '''
+    SELECT a.*, e.name FROM attendance a
+    JOIN employees e ON a.emp_id = e.emp_id
+    WHERE date = ?
+    ORDER BY a.date DESC
+'''
+ATTENDANCE_RECENT_SQL = '''
+    SELECT a.*, e.name FROM attendance a
+    JOIN employees e ON a.emp_id = e.emp_id
+    ORDER BY a.date DESC LIMIT 50
+'''
+
+
 @app.route('/attendance_list', methods=['GET'])
 def attendance_list():
     if 'user' not in session:
@@ -1650,18 +3884,9 @@ def attendance_list():
     # Filter by date
     date_filter = request.args.get('date', '')
     if date_filter:
-        cur.execute('''
-            SELECT a.*, e.name FROM attendance a
-            JOIN employees e ON a.emp_id = e.emp_id
-            WHERE date = ?
-            ORDER BY a.date DESC
-        ''', (date_filter,))
+        cur.execute(ATTENDANCE_DAY_SQL, (date_filter,))
     else:
-        cur.execute('''
-            SELECT a.*, e.name FROM attendance a
-            JOIN employees e ON a.emp_id = e.emp_id
-            ORDER BY a.date DESC LIMIT 50
-        ''')
+        cur.execute(ATTENDANCE_RECENT_SQL)
 
     records = cur.fetchall()
     conn.close()
@@ -1669,27 +3894,411 @@ def attendance_list():
 
 
 
+# ---------- ✅ Attendance Register / Summary ----------
+# A month is loaded with one query (every employee LEFT JOIN that month's
+# attendance) and shaped with pandas: a pivot gives the employee × day
+# register, a groupby gives the per-employee counts and hours. Finished months
+# are cached in-process, keyed on the month's data version, so a month is only
+# rebuilt after attendance or employee records change.
+
+LATE_AFTER = os.environ.get("LATE_AFTER", "09:30")  # check-ins after this are late
+ATTENDANCE_MONTH_CACHE_SIZE = 24
+ATTENDANCE_MARKS = {"Present": "P", "Absent": "A", "Leave": "L"}
+
+_attendance_month_cache = OrderedDict()
+
+ATTENDANCE_MONTH_SQL = """
+    SELECT e.emp_id, e.name, e.department, a.date, a.status, a.check_in, a.check_out
+    FROM (SELECT emp_id, MIN(name) AS name, MIN(department) AS department
+          FROM employees WHERE emp_id IS NOT NULL GROUP BY emp_id) e
+    LEFT JOIN attendance a ON a.emp_id = e.emp_id AND a.date BETWEEN ? AND ?
+    ORDER BY e.emp_id
+"""
+
+
+def parse_clock(times):
+    """'HH:MM' or 'HH:MM:SS' strings -> Timedelta (NaT when blank or invalid)."""
+    times = times.fillna("").astype(str).str.strip()
+    times = times.where(times.str.count(":") != 1, times + ":00")
+    return pd.to_timedelta(times.where(times != "", None), errors="coerce")
+
+
+def attendance_month(month):
+    """Register and summary for a 'YYYY-MM' month: (days, rows).
+
+    `rows` has one dict per employee with the day-by-day marks and the
+    present / absent / leave / late counts and hours worked.
+    """
+    cur = get_db().cursor()
+    key = (month, data_version(cur, f"attendance:{month}"), data_version(cur, "employees"))
+    if key in _attendance_month_cache:
+        _attendance_month_cache.move_to_end(key)
+        return _attendance_month_cache[key]
+
+    days = list(range(1, pd.Period(month).days_in_month + 1))
+    cur.execute(ATTENDANCE_MONTH_SQL, (f"{month}-01", f"{month}-{days[-1]:02d}"))
+    df = pd.DataFrame([tuple(row) for row in cur.fetchall()],
+                      columns=["emp_id", "name", "department", "date", "status", "check_in", "check_out"])
+
+    employees = df.drop_duplicates("emp_id").set_index("emp_id")[["name", "department"]]
+    marked = df.dropna(subset=["date"]).copy()
+    marked["day"] = pd.to_datetime(marked["date"], errors="coerce").dt.day
+    marked = marked.dropna(subset=["day"])
+    marked["mark"] = marked["status"].map(ATTENDANCE_MARKS).fillna("")
+    check_in = parse_clock(marked["check_in"])
+    worked = (parse_clock(marked["check_out"]) - check_in).dt.total_seconds() / 3600
+    marked["hours"] = worked.where(worked > 0, 0).fillna(0)
+    marked["late"] = (marked["status"] == "Present") & (check_in > pd.to_timedelta(f"{LATE_AFTER}:00"))
+
+    register = (marked.pivot_table(index="emp_id", columns="day", values="mark", aggfunc="last")
+                .reindex(index=employees.index, columns=days).fillna(""))
+    counts = pd.DataFrame({
+        "present": marked["status"].eq("Present"),
+        "absent": marked["status"].eq("Absent"),
+        "leave": marked["status"].eq("Leave"),
+        "late": marked["late"],
+        "hours": marked["hours"],
+        "emp_id": marked["emp_id"],
+    }).groupby("emp_id").sum().reindex(employees.index, fill_value=0)
+
+    rows = []
+    for emp_id, emp in employees.iterrows():
+        c = counts.loc[emp_id]
+        rows.append({
+            "emp_id": emp_id, "name": emp["name"], "department": emp["department"],
+            "marks": register.loc[emp_id].tolist(),
+            "present": int(c["present"]), "absent": int(c["absent"]), "leave": int(c["leave"]),
+            "late": int(c["late"]), "hours": round(float(c["hours"]), 2),
+            "total_days": int(c["present"] + c["absent"] + c["leave"]),
+        })
+
+    _attendance_month_cache[key] = (days, rows)
+    while len(_attendance_month_cache) > ATTENDANCE_MONTH_CACHE_SIZE:
+        _attendance_month_cache.popitem(last=False)
+    return days, rows
+
+
+def requested_month():
+    month = request.args.get('month') or datetime.today().strftime('%Y-%m')
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        month = datetime.today().strftime('%Y-%m')
+    return month
+
+
+@app.route('/attendance_register')
+def attendance_register():
+    if 'user' not in session:
+        return redirect(url_for('login'))
+
+    month = requested_month()
+    days, rows = attendance_month(month)
+    department = request.args.get('department', '')
+    if department:
+        rows = [r for r in rows if r['department'] == department]
+    return render_template("attendance_register.html", month=month, days=days, rows=rows,
+                           selected_department=department)
+
+
+@app.route('/attendance_summary')
+def attendance_summary():
+    if 'user' not in session:
+        return redirect(url_for('login'))
+
+    month = requested_month()
+    _, rows = attendance_month(month)
+    emp_id = request.args.get('emp_id', '').strip()
+    if emp_id:
+        rows = [r for r in rows if r['emp_id'] == emp_id]
+    return render_template("attendance_summary.html", month=month, summaries=rows, late_after=LATE_AFTER)
+
+
+# ---------- ✅ Attendance Export ----------
+# Rows are read lazily from the cursor and written straight into the response
+# (xlsx through iter_xlsx, or CSV), so memory use does not grow with history.
+
+ATTENDANCE_EXPORT_HEADER = ["Employee ID", "Name", "Department", "Date", "Status", "Check-In", "Check-Out"]
+CSV_FLUSH_EVERY_ROWS = 500
+
+
+def attendance_rows_sql(start_date=None, end_date=None, department=None, emp_id=None):
+    """SQL + params for the attendance export, newest day first."""
+    query = '''
+        SELECT a.emp_id, e.name, e.department, a.date, a.status, a.check_in, a.check_out
+        FROM attendance a
+        JOIN employees e ON a.emp_id = e.emp_id
+        WHERE 1=1
+    '''
+    params = []
+    if start_date:
+        query += " AND a.date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND a.date <= ?"
+        params.append(end_date)
+    if department:
+        query += " AND e.department = ?"
+        params.append(department)
+    if emp_id:
+        query += " AND a.emp_id = ?"
+        params.append(emp_id)
+    query += " ORDER BY a.date DESC, a.emp_id"
+    return query, params
+
+
+def iter_attendance_rows(start_date=None, end_date=None, department=None, emp_id=None):
+    """Yield export rows from a private connection, which outlives the
+    request's pooled one while the response streams."""
+    conn = open_db()
+    try:
+        cur = conn.execute(*attendance_rows_sql(start_date, end_date, department, emp_id))
+        yield from (tuple(row) for row in cur)
+    finally:
+        conn.close()
+
+
+def iter_csv(header, rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % CSV_FLUSH_EVERY_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def attendance_export_response(args):
+    filters = {key: (args.get(key) or '').strip() or None
+               for key in ('start_date', 'end_date', 'department', 'emp_id')}
+    for key in ('start_date', 'end_date'):
+        if filters[key]:
+            try:
+                datetime.strptime(filters[key], '%Y-%m-%d')
+            except ValueError:
+                return f"Invalid {key.replace('_', ' ')}", 400
+
+    name = "Attendance_Report"
+    if filters['start_date'] or filters['end_date']:
+        name += f"_{filters['start_date'] or 'start'}_to_{filters['end_date'] or 'today'}"
+    rows = iter_attendance_rows(**filters)
+
+    if args.get('format') == 'csv':
+        return Response(stream_with_context(iter_csv(ATTENDANCE_EXPORT_HEADER, rows)), mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename={name}.csv"})
+    return Response(stream_with_context(iter_xlsx(ATTENDANCE_EXPORT_HEADER, rows, sheet_title="Attendance")),
+                    mimetype=XLSX_MIMETYPE,
+                    headers={"Content-Disposition": f"attachment; filename={name}.xlsx"})
+
+
 @app.route('/export_attendance_excel')
 def export_attendance_excel():
-    import pandas as pd
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    return attendance_export_response(request.args)
 
-    conn = get_db()
+
+@app.route('/download_attendance_report', methods=['GET', 'POST'])
+def download_attendance_report():
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    if request.method == 'POST':
+        return attendance_export_response(request.form)
+
+    cur = get_db().cursor()
+    cur.execute("SELECT DISTINCT department FROM employees WHERE department IS NOT NULL ORDER BY department")
+    departments = [row['department'] for row in cur.fetchall()]
+    return render_template("attendance_report_download.html", departments=departments)
+
+
+def write_attendance_excel(out):
+    for chunk in iter_xlsx(ATTENDANCE_EXPORT_HEADER, iter_attendance_rows(),
+                           sheet_title="Attendance"):
+        out.write(chunk)
+    return "Attendance_Report.xlsx"
+
+
+# ---------- ✅ Background Jobs ----------
+# Heavy exports run on a small thread pool instead of inside the request.
+# POST /jobs queues one and returns its id; the client polls /jobs/<id> and
+# fetches /jobs/<id>/download once it is done. Jobs belong to the user who
+# queued them. An identical request from the same user that is already queued
+# or running is answered with the existing job (the partial unique index on
+# jobs.dedupe_key enforces this across workers).
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_STALE_MINUTES = 30      # queued/running longer than this = its worker died
+JOB_ARTIFACT_HOURS = 24     # finished artifacts are deleted after this
+ARTIFACT_DIR = os.path.join(app.instance_path, "artifacts")
+
+
+def job_project_pdf(out, project_id):
+    return f"{render_project_pdf(project_id, out)}_duct_table.pdf"
+
+
+JOB_KINDS = {
+    "project_pdf": {"writer": job_project_pdf, "params": ["project_id"],
+                    "mimetype": "application/pdf", "extension": "pdf"},
+    "project_excel": {"writer": lambda out, project_id: write_project_excel(project_id, out),
+                      "params": ["project_id"], "mimetype": XLSX_MIMETYPE, "extension": "xlsx"},
+    "employees_excel": {"writer": write_employees_excel, "params": [],
+                        "mimetype": XLSX_MIMETYPE, "extension": "xlsx"},
+    "attendance_excel": {"writer": write_attendance_excel, "params": [],
+                         "mimetype": XLSX_MIMETYPE, "extension": "xlsx"},
+    "summary": {"writer": write_summary_report, "params": ["project_id"],
+                "mimetype": "application/pdf", "extension": "pdf"},
+    "summary_pack": {"writer": write_summary_pack, "params": [],
+                     "mimetype": "application/zip", "extension": "zip"},
+}
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+def job_payload(job):
+    payload = {key: job[key] for key in ("id", "kind", "status", "error", "created_at",
+                                         "started_at", "finished_at", "download_name")}
+    payload["params"] = json.loads(job["params"])
+    payload["status_url"] = url_for("job_status", job_id=job["id"])
+    if job["status"] == "done":
+        payload["download_url"] = url_for("job_download", job_id=job["id"])
+    return payload
+
+
+def expire_jobs(conn):
+    """Fail jobs whose worker went away and delete old artifacts."""
     cur = conn.cursor()
-    cur.execute('''
-        SELECT a.emp_id, e.name, a.date, a.status, a.check_in, a.check_out
-        FROM attendance a
-        JOIN employees e ON a.emp_id = e.emp_id
-        ORDER BY a.date DESC
-    ''')
-    data = cur.fetchall()
-    conn.close()
+    cur.execute("""
+        UPDATE jobs SET status = 'failed', error = 'Interrupted before finishing',
+                        finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running') AND created_at < datetime('now', ?)
+    """, (f"-{JOB_STALE_MINUTES} minutes",))
+    cur.execute("""
+        SELECT id, artifact_path FROM jobs
+        WHERE status = 'done' AND finished_at < datetime('now', ?)
+    """, (f"-{JOB_ARTIFACT_HOURS} hours",))
+    for job in cur.fetchall():
+        if job["artifact_path"] and os.path.exists(job["artifact_path"]):
+            os.remove(job["artifact_path"])
+        conn.execute("UPDATE jobs SET status = 'expired', artifact_path = NULL WHERE id = ?", (job["id"],))
+    conn.commit()
+
+
+JOB_SQL = "SELECT * FROM jobs WHERE id = ?"
+JOB_IN_FLIGHT_SQL = "SELECT * FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')"
+
+
+def submit_job(kind, params, owner):
+    """Queue a job for `owner` (a session user_key), or return the identical
+    one they already have in flight.
+
+    Returns (job row, created).
+    """
+    conn = get_db()
+    expire_jobs(conn)
+    dedupe_key = f"{owner}:{kind}:{json.dumps(params, sort_keys=True)}"
+    for _ in range(3):
+        job_id = uuid.uuid4().hex
+        try:
+            conn.execute("INSERT INTO jobs (id, kind, params, dedupe_key, created_by) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, kind, json.dumps(params), dedupe_key, owner))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            existing = conn.execute(JOB_IN_FLIGHT_SQL, (dedupe_key,)).fetchone()
+            if existing:
+                return existing, False
+            continue  # it finished in between; try again
+        _job_executor.submit(run_job, job_id)
+        return conn.execute(JOB_SQL, (job_id,)).fetchone(), True
+    raise RuntimeError(f"Could not queue {kind} job")
+
+
+def run_job(job_id):
+    with app.app_context():
+        conn = get_db()
+        cur = conn.execute("UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP "
+                           "WHERE id = ? AND status = 'queued'", (job_id,))
+        conn.commit()
+        if cur.rowcount != 1:
+            return
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        spec = JOB_KINDS[job["kind"]]
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        path = os.path.join(ARTIFACT_DIR, f"{job_id}.{spec['extension']}")
+        try:
+            with open(path + ".part", "wb") as out:
+                download_name = spec["writer"](out, **json.loads(job["params"]))
+            os.replace(path + ".part", path)
+        except Exception as e:
+            print(f"❌ Job {job_id} ({job['kind']}) failed: {e}")
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+            conn.rollback()
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP "
+                         "WHERE id = ?", (str(e), job_id))
+            conn.commit()
+            return
+        conn.execute("""
+            UPDATE jobs SET status = 'done', artifact_path = ?, download_name = ?, mimetype = ?,
+                            finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (path, download_name, spec["mimetype"], job_id))
+        conn.commit()
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    if 'user' not in session:
+        return jsonify(status="error", message="Login required"), 401
+
+    data = request.get_json(silent=True) or request.form
+    kind = data.get("kind")
+    if kind not in JOB_KINDS:
+        return jsonify(status="error", message=f"Unknown job kind '{kind}'"), 400
+
+    params = {}
+    for name in JOB_KINDS[kind]["params"]:
+        try:
+            params[name] = int(data.get(name))
+        except (TypeError, ValueError):
+            return jsonify(status="error", message=f"'{name}' must be an integer"), 400
+
+    job, created = submit_job(kind, params, session.get('user_key'))
+    return jsonify(status="success", deduplicated=not created, job=job_payload(job)), 202 if created else 200
+
+
+def own_job(job_id):
+    """The job if the logged-in user queued it, else None."""
+    job = get_db().execute(JOB_SQL, (job_id,)).fetchone()
+    if job and job["created_by"] and job["created_by"] == session.get('user_key'):
+        return job
+    return None
 
-    df = pd.DataFrame(data, columns=["Employee ID", "Name", "Date", "Status", "Check-In", "Check-Out"])
-    path = "/tmp/attendance_report.xlsx"
-    df.to_excel(path, index=False)
 
-    return send_file(path, as_attachment=True, download_name="Attendance_Report.xlsx")
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if 'user' not in session:
+        return jsonify(status="error", message="Login required"), 401
+    job = own_job(job_id)
+    if not job:
+        return jsonify(status="error", message="Job not found"), 404
+    return jsonify(status="success", job=job_payload(job))
+
 
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    if 'user' not in session:
+        return jsonify(status="error", message="Login required"), 401
+    job = own_job(job_id)
+    if not job:
+        return jsonify(status="error", message="Job not found"), 404
+    if job["status"] != "done" or not os.path.exists(job["artifact_path"] or ""):
+        return jsonify(status="error", message=f"Job is {job['status']}"), 409
+    return send_file(job["artifact_path"], as_attachment=True,
+                     download_name=job["download_name"], mimetype=job["mimetype"])
 
 
 # 🔽 Add the download route after other routes
@@ -1736,6 +4345,8 @@ def debug_data():
 
 # ---------- ✅ Run Flask App ----------
 
+init_db()
+
 if __name__ == "__main__":
     import os
     port = int(os.environ.get("PORT", 5000))
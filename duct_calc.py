@@ -0,0 +1,133 @@
+"""Duct geometry and material calculations.
+
+calculate_duct() works on a single duct; calculate_ducts() takes whole columns
+(a DataFrame, or a mapping of NumPy arrays / pandas Series) and derives every
+row in one vectorized pass. The scalar API runs through the same vectorized
+formulas, so both always return identical values.
+"""
+import numpy as np
+import pandas as pd
+
+# Largest width and height (mm) each gauge covers, thinnest sheet first
+GAUGE_LIMITS = [('24g', 751), ('22g', 1201), ('20g', 1800)]
+HEAVIEST_GAUGE = '18g'
+GAUGES = [g for g, _ in GAUGE_LIMITS] + [HEAVIEST_GAUGE]
+
+CLEAT_FACTOR = {'24g': 4, '22g': 8, '20g': 10, '18g': 12}
+WEIGHT_PER_M2 = {'24g': 4.0, '22g': 5.0, '20g': 6.0, '18g': 7.5}
+NUTS_BOLTS_PER_DUCT = 4
+CORNER_PIECES_PER_DUCT = 8
+
+INPUT_COLUMNS = ['duct_type', 'width1', 'height1', 'width2', 'height2', 'quantity',
+                 'length_or_radius', 'degree_or_offset', 'factor']
+DERIVED_COLUMNS = ['area', 'gauge', 'nuts_bolts', 'cleat', 'gasket', 'corner_pieces', 'weight']
+
+
+def _round2(values):
+    """Round to 2 places exactly as round() does.
+
+    np.round scales by 100 first and disagrees with round() on a few percent
+    of real areas and weights; '%.2f' rounds the stored value itself.
+
+    >>> values = [6.065, 2.675, 1.055, 0.125]
+    >>> _round2(np.array(values)).tolist() == [round(v, 2) for v in values]
+    True
+    """
+    return np.char.mod('%.2f', np.asarray(values, dtype=float)).astype(float)
+
+
+def _derive(duct_type, w1, h1, w2, h2, qty, length, deg, factor):
+    """Apply every formula to equal-length arrays and return the derived columns."""
+    area = np.select(
+        [
+            duct_type == 'ST',
+            duct_type == 'RED',
+            duct_type == 'DUM',
+            duct_type == 'OFFSET',
+            duct_type == 'SHOE',
+            duct_type == 'VANES',
+            duct_type == 'ELB',
+        ],
+        [
+            2 * (w1 + h1) / 1000 * (length / 1000) * qty,
+            (w1 + h1 + w2 + h2) / 1000 * (length / 1000) * qty * factor,
+            (w1 * h1) / 1000000 * qty,
+            (w1 + h1 + w2 + h2) / 1000 * ((length + deg) / 1000) * qty * factor,
+            (w1 + h1) * 2 / 1000 * (length / 1000) * qty * factor,
+            w1 / 1000 * (2 * np.pi * (w1 / 1000) / 4) * qty,
+            2 * (w1 + h1) / 1000 * ((h1 / 2 / 1000) + (length / 1000) * (np.pi * (deg / 180))) * qty * factor,
+        ],
+        default=0.0,
+    )
+
+    gauge = np.select(
+        [(w1 <= limit) & (h1 <= limit) for _, limit in GAUGE_LIMITS],
+        [g for g, _ in GAUGE_LIMITS],
+        default=HEAVIEST_GAUGE,
+    ).astype(object)
+
+    cleat_factor = np.select([gauge == g for g in GAUGES], [CLEAT_FACTOR[g] for g in GAUGES])
+    weight_per_m2 = np.select([gauge == g for g in GAUGES], [WEIGHT_PER_M2[g] for g in GAUGES])
+
+    return {
+        'area': _round2(area),
+        'gauge': gauge,
+        'nuts_bolts': qty * NUTS_BOLTS_PER_DUCT,
+        'cleat': qty * cleat_factor,
+        'gasket': _round2((w1 + h1 + w2 + h2) / 1000 * qty),
+        'corner_pieces': np.where(duct_type == 'DUM', 0, qty * CORNER_PIECES_PER_DUCT),
+        'weight': _round2(area * weight_per_m2),
+    }
+
+
+def _numeric(values, default):
+    return pd.to_numeric(pd.Series(values), errors='coerce').fillna(default).to_numpy(dtype=float)
+
+
+def calculate_ducts(columns):
+    """Derive area, gauge and material columns for many ducts at once.
+
+    `columns` is a DataFrame or mapping holding INPUT_COLUMNS. Blank or
+    non-numeric measurements count as 0 and a blank factor as 1.0, the same
+    as the entry forms. Returns a DataFrame of DERIVED_COLUMNS aligned with
+    the input rows.
+    """
+    duct_type = pd.Series(columns['duct_type']).fillna('').astype(str).str.strip().str.upper()
+    qty = _numeric(columns['quantity'], 0).astype(np.int64)
+    derived = _derive(
+        duct_type.to_numpy(dtype=object),
+        _numeric(columns['width1'], 0),
+        _numeric(columns['height1'], 0),
+        _numeric(columns['width2'], 0),
+        _numeric(columns['height2'], 0),
+        qty,
+        _numeric(columns['length_or_radius'], 0),
+        _numeric(columns['degree_or_offset'], 0),
+        _numeric(columns['factor'], 1.0),
+    )
+    index = columns.index if isinstance(columns, pd.DataFrame) else None
+    return pd.DataFrame(derived, columns=DERIVED_COLUMNS, index=index)
+
+
+def calculate_duct(duct_type, width1=0, height1=0, width2=0, height2=0, quantity=0,
+                   length_or_radius=0, degree_or_offset=0, factor=1.0):
+    """Derive area, gauge and material quantities for a single duct.
+
+    Matches the per-row formulas the entry forms used before, including
+    round()'s results where np.round would differ (area 1.055, weight 5.275):
+
+    >>> calculate_duct('ST', 755, 300, quantity=1, length_or_radius=500)
+    {'area': 1.05, 'gauge': '22g', 'nuts_bolts': 4, 'cleat': 8, 'gasket': 1.05, 'corner_pieces': 8, 'weight': 5.27}
+    """
+    derived = calculate_ducts({
+        'duct_type': [duct_type],
+        'width1': [width1],
+        'height1': [height1],
+        'width2': [width2],
+        'height2': [height2],
+        'quantity': [quantity],
+        'length_or_radius': [length_or_radius],
+        'degree_or_offset': [degree_or_offset],
+        'factor': [factor],
+    })
+    return {column: derived[column].tolist()[0] for column in DERIVED_COLUMNS}